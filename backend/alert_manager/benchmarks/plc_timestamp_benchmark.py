@@ -0,0 +1,135 @@
+"""Benchmark plc_timestamp against the previous strptime based conversions.
+
+Usage:
+    python backend/alert_manager/benchmarks/plc_timestamp_benchmark.py [count]
+
+The script first checks that both implementations return identical output for
+every generated timestamp, then prints the time taken by each implementation.
+"""
+
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+from dateutil.tz import gettz
+
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "..", "lambda", "common", "python")
+)
+
+from plc_timestamp import (  # noqa: E402
+    convert_jst_to_utc,
+    convert_jst_to_utc_batch,
+    timestream_to_iso,
+    timestream_to_iso_batch,
+)
+
+
+def legacy_convert_jst_to_utc(timestamp: str) -> str:
+    # publish_error_topic.convert_jst_to_utc の従来の実装
+    timestamp_jst = datetime.strptime(timestamp + "+0900", "%Y%m%d %H:%M:%S.%f%z")
+    timestamp_utc = timestamp_jst.astimezone(gettz("UTC")).strftime(
+        "%Y-%m-%d %H:%M:%S.%f"
+    )
+    timestamp_utc = timestamp_utc.replace(" ", "T") + "Z"
+    return timestamp_utc
+
+
+def legacy_timestream_to_iso(timestamp: str) -> str:
+    # get_plc_data.shape_response の従来の実装
+    timestamp = timestamp.rstrip("000")
+    timestamp_obj = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S.%f")
+    return timestamp_obj.isoformat() + "Z"
+
+
+def generate_timestamps(count: int) -> tuple[list[str], list[str]]:
+    # 連続したサンプリングを模して、ランダムな開始時刻から 100ms 前後の間隔で時刻を生成する
+    start = datetime(2024, 1, 1) + timedelta(seconds=random.randint(0, 365 * 86400))
+    plc_timestamps = []
+    timestream_timestamps = []
+    timestamp = start
+    for _ in range(count):
+        timestamp += timedelta(microseconds=random.randint(1, 200_000))
+        plc_timestamps.append(timestamp.strftime("%Y%m%d %H:%M:%S.%f"))
+        timestream_timestamps.append(
+            timestamp.strftime("%Y-%m-%d %H:%M:%S.%f") + "000"
+        )
+    # 日付・月・年をまたぐ時刻
+    plc_timestamps += [
+        "20240101 00:00:00.000001",
+        "20240301 08:59:59.999999",
+        "20241231 09:00:00.5",
+    ]
+    return plc_timestamps, timestream_timestamps
+
+
+def check_identical(plc_timestamps: list[str], timestream_timestamps: list[str]):
+    for timestamp in plc_timestamps:
+        expected = legacy_convert_jst_to_utc(timestamp)
+        assert convert_jst_to_utc(timestamp) == expected, timestamp
+    assert convert_jst_to_utc_batch(plc_timestamps) == [
+        legacy_convert_jst_to_utc(timestamp) for timestamp in plc_timestamps
+    ]
+
+    # 従来の実装はマイクロ秒が 0 の時刻で ValueError となるため、比較対象から除く
+    fixed = 0
+    for timestamp in timestream_timestamps:
+        try:
+            expected = legacy_timestream_to_iso(timestamp)
+        except ValueError:
+            fixed += 1
+            continue
+        assert timestream_to_iso(timestamp) == expected, timestamp
+    return fixed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    plc_timestamps, timestream_timestamps = generate_timestamps(count)
+    fixed = check_identical(plc_timestamps, timestream_timestamps)
+    print(f"identical output for {len(plc_timestamps)} PLC timestamps")
+    print(
+        f"identical output for {len(timestream_timestamps) - fixed} Timestream timestamps"
+        f" ({fixed} timestamps the legacy implementation could not parse)"
+    )
+
+    valid_timestream_timestamps = [
+        timestamp
+        for timestamp in timestream_timestamps
+        if timestamp[20:26] != "000000"
+    ]
+    cases = [
+        (
+            "convert_jst_to_utc (legacy)",
+            lambda: [legacy_convert_jst_to_utc(t) for t in plc_timestamps],
+        ),
+        (
+            "convert_jst_to_utc",
+            lambda: [convert_jst_to_utc(t) for t in plc_timestamps],
+        ),
+        (
+            "convert_jst_to_utc_batch",
+            lambda: convert_jst_to_utc_batch(plc_timestamps),
+        ),
+        (
+            "timestream_to_iso (legacy)",
+            lambda: [legacy_timestream_to_iso(t) for t in valid_timestream_timestamps],
+        ),
+        (
+            "timestream_to_iso",
+            lambda: [timestream_to_iso(t) for t in valid_timestream_timestamps],
+        ),
+        (
+            "timestream_to_iso_batch",
+            lambda: timestream_to_iso_batch(valid_timestream_timestamps),
+        ),
+    ]
+    for name, func in cases:
+        seconds = min(timeit.repeat(func, number=1, repeat=5))
+        print(f"{name:32s} {seconds * 1000:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,21 @@
-import json
 import os
 from http import HTTPMethod, HTTPStatus
 
-import boto3
-from boto3.dynamodb.conditions import Key
-
-dynamoDB = boto3.resource("dynamodb")
+import aws_clients
+from alert_version import bump_version
+from http_response import response
 
 
 def handler(event, context):
     try:
         status_code = HTTPStatus.OK
         TABLE_NAME = os.environ["TABLE_NAME"]
-        table = dynamoDB.Table(TABLE_NAME)
+        table = aws_clients.table(TABLE_NAME)
 
         # HTTP Method のチェック
         if event["httpMethod"] != HTTPMethod.DELETE:
             status_code = HTTPStatus.METHOD_NOT_ALLOWED
-            return {
-                "statusCode": status_code,
-                "headers": {"Content-Type": "text/plain"},
-            }
+            return response(status_code, event=event, content_type="text/plain")
         # Query Parameter のチェック
         alert_id = event.get("pathParameters").get("alert_id")
         if alert_id != None:
@@ -29,11 +24,7 @@ def handler(event, context):
             # Alert_idがなかった場合は422を返す
             status_code = HTTPStatus.UNPROCESSABLE_ENTITY
 
-        return {
-            "statusCode": status_code,
-            "headers": {"Content-Type": "application/json"},
-            "body": json.dumps({}),
-        }
+        return response(status_code, {}, event)
     except Exception as e:
         print(e)
         raise e
@@ -42,11 +33,13 @@ def handler(event, context):
 def delete_alert_by_id(table, alert_id: str) -> int:
     try:
         # alert_idで検索して、見つかったら削除する
-        response = query_db(table, alert_id)
-        if len(response) == 0:
+        items = query_db(table, alert_id)
+        if len(items) == 0:
             return HTTPStatus.NOT_FOUND
         else:
             table.delete_item(Key={"id": alert_id})
+            # アラートの一覧のキャッシュを無効にする
+            bump_version()
             return HTTPStatus.OK
 
     except Exception as e:
@@ -55,6 +48,8 @@ def delete_alert_by_id(table, alert_id: str) -> int:
 
 
 def query_db(table, alert_id: str) -> dict:
+    from boto3.dynamodb.conditions import Key
+
     try:
         response = table.query(KeyConditionExpression=Key("id").eq(alert_id))
     except Exception as e:
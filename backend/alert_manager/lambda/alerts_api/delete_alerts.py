@@ -1,35 +1,24 @@
-import json
 import os
 from http import HTTPMethod, HTTPStatus
 
-import boto3
-
-dynamoDB = boto3.resource("dynamodb")
+import aws_clients
+from alert_version import bump_version
+from http_response import response
 
 
 def handler(event, context):
     status_code = HTTPStatus.OK
     TABLE_NAME = os.environ["TABLE_NAME"]
-    table = dynamoDB.Table(TABLE_NAME)
+    table = aws_clients.table(TABLE_NAME)
 
     # HTTP Method のチェック
     if event["httpMethod"] != HTTPMethod.DELETE:
         status_code = HTTPStatus.METHOD_NOT_ALLOWED
-        return {
-            "statusCode": status_code,
-            "headers": {"Content-Type": "text/plain"},
-        }
+        return response(status_code, event=event, content_type="text/plain")
 
     status_code = delete_data(table)
 
-    return {
-        "statusCode": status_code,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-        },
-        "body": json.dumps({}),
-    }
+    return response(status_code, {}, event)
 
 
 def delete_data(table) -> int:
@@ -42,6 +31,8 @@ def delete_data(table) -> int:
             for item in response["Items"]:
                 alert_id = item["alert_id"]
                 table.delete_item(Key={"id": alert_id})
+            # アラートの一覧のキャッシュを無効にする
+            bump_version()
             status_code = HTTPStatus.OK
 
     except Exception as e:
@@ -1,52 +1,78 @@
-import json
 import os
 from http import HTTPMethod, HTTPStatus
 
-import boto3
-from boto3.dynamodb.conditions import Key
-
-dynamoDB = boto3.resource("dynamodb")
+import aws_clients
+from alert_codec import (
+    catalog_from_env,
+    decode_many,
+    parse_fields,
+    projection,
+    select_fields,
+)
+from http_response import is_not_modified, make_etag, not_modified, response
 
 
 def handler(event, context):
     try:
         status_code = HTTPStatus.OK
         TABLE_NAME = os.environ["TABLE_NAME"]
-        table = dynamoDB.Table(TABLE_NAME)
+        table = aws_clients.table(TABLE_NAME)
 
         # HTTP Method のチェック
         if event["httpMethod"] != HTTPMethod.GET:
             status_code = HTTPStatus.METHOD_NOT_ALLOWED
-            return {
-                "statusCode": status_code,
-                "headers": {"Content-Type": "text/plain"},
-            }
+            return response(status_code, event=event, content_type="text/plain")
 
         # Query Parameter のチェック
+        # fields : 返す属性。カンマ区切りで指定する(デフォルトはすべての属性)
+        try:
+            fields = parse_fields(
+                (event.get("queryStringParameters") or {}).get("fields"), None
+            )
+        except ValueError as e:
+            return response(
+                HTTPStatus.BAD_REQUEST, str(e), event, content_type="text/plain"
+            )
         alert_id = event.get("pathParameters").get("alert_id")
         if alert_id != None:
-            response = query_db(table, alert_id)
+            items = query_db(table, alert_id, fields)
             # なければ422を返す
-            if len(response) == 0:
+            if len(items) == 0:
                 status_code = HTTPStatus.UNPROCESSABLE_ENTITY
         else:
             # Alert_idがなかった場合は422を返す
             status_code = HTTPStatus.UNPROCESSABLE_ENTITY
-            response = {}
+            items = {}
+
+        # アラートの内容から ETag を作成し、クライアントが持っている内容と同じ場合は 304 を返す
+        etag = make_etag(int(status_code), items)
+        if is_not_modified(event, etag):
+            return not_modified(etag, {"Access-Control-Expose-Headers": "ETag"})
 
-        return {
-            "statusCode": status_code,
-            "headers": {"Content-Type": "application/json"},
-            "body": json.dumps(response),
-        }
+        return response(
+            status_code,
+            items,
+            event,
+            {"Access-Control-Expose-Headers": "ETag"},
+            etag=etag,
+        )
     except Exception as e:
         print(e)
         raise e
 
 
-def query_db(table, alert_id: str) -> dict:
+def query_db(table, alert_id: str, fields: list | None = None) -> dict:
+    from boto3.dynamodb.conditions import Key
+
+    kwargs = {"KeyConditionExpression": Key("id").eq(alert_id)}
+    if fields is not None:
+        kwargs.update(projection(fields))
     try:
-        response = table.query(KeyConditionExpression=Key("id").eq(alert_id))
+        response = table.query(**kwargs)
     except Exception as e:
         raise e
-    return response["Items"]
+    # コンパクト形式で保存されたアラートを展開し、指定された属性だけを返す
+    return [
+        select_fields(item, fields)
+        for item in decode_many(response["Items"], catalog_from_env())
+    ]
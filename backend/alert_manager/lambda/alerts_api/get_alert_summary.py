@@ -0,0 +1,32 @@
+import os
+from http import HTTPMethod, HTTPStatus
+
+import aws_clients
+from alert_summary import SUMMARY_ID, to_summary
+from http_response import is_not_modified, make_etag, not_modified, response
+
+
+def handler(event, context):
+    try:
+        status_code = HTTPStatus.OK
+        SUMMARY_TABLE_NAME = os.environ["SUMMARY_TABLE_NAME"]
+        table = aws_clients.table(SUMMARY_TABLE_NAME)
+
+        # HTTP Method のチェック
+        if event["httpMethod"] != HTTPMethod.GET:
+            status_code = HTTPStatus.METHOD_NOT_ALLOWED
+            return response(status_code, event=event, content_type="text/plain")
+
+        # アラートの一覧を読み込まず、件数の項目を 1 回の GetItem で取得する
+        item = table.get_item(Key={"id": SUMMARY_ID}).get("Item")
+        summary = to_summary(item)
+
+        headers = {"Access-Control-Expose-Headers": "ETag"}
+        etag = make_etag(int(status_code), summary)
+        if is_not_modified(event, etag):
+            return not_modified(etag, headers)
+
+        return response(status_code, summary, event, headers, etag=etag)
+    except Exception as e:
+        print(e)
+        raise e
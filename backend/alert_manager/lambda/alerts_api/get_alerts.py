@@ -1,60 +1,398 @@
-import json
 import os
 from http import HTTPMethod, HTTPStatus
+from itertools import islice
 from typing import Literal
 
-import boto3
-from boto3.dynamodb.conditions import Key
+import aws_clients
+from alert_codec import (
+    catalog_from_env,
+    decode_many,
+    parse_fields,
+    projection,
+    select_fields,
+)
+from alert_version import read_version
+from http_response import dumps, is_not_modified, make_etag, not_modified, response
 
-dynamoDB = boto3.resource("dynamodb")
-
-type_status = Literal["OPEN", "CLOSE"]
+type_status = Literal["OPEN", "CLOSE", "CLOSED"]
 DEFAULT_LIMIT = 250
+MAX_LIMIT = 500
 DEFAULT_STATUSES: list[type_status] = ["OPEN", "CLOSE"]
+ALLOWED_STATUSES: list[type_status] = ["OPEN", "CLOSE", "CLOSED"]
+ALLOWED_SEVERITIES = ["CRITICAL", "HIGH", "MEDIUM", "LOW"]
+NEXT_TOKEN_HEADER = "X-Next-Token"
+EXPOSE_HEADERS = ", ".join([NEXT_TOKEN_HEADER, "ETag"])
+# 一覧画面で表示する属性。fields パラメーターを指定しない場合はこれらの属性だけを返す
+LIST_FIELDS = ["id", "status", "severity", "category", "name", "openedAt", "closedAt"]
+# マージと続きの取得に必要な属性(インデックスのキー)
+REQUIRED_FIELDS = ("id", "openedAt", "status", "category")
+# カテゴリのインデックスの名前。インデックスがない場合は status-index をカテゴリで絞り込む
+CATEGORY_INDEX_NAME = os.environ.get("CATEGORY_INDEX_NAME")
+# JSON に変換した一覧をコンテナ内にキャッシュする件数(0 の場合はキャッシュしない)
+PAGE_CACHE_SIZE = int(os.environ.get("ALERT_PAGE_CACHE_SIZE", "64"))
+
+# コールドスタートを短くするため、base64 / heapq / json / datetime は import 時ではなく利用時に import する。
+
+# {(バージョン, クエリ): (ステータスコード, JSON に変換した一覧, ヘッダー)}
+# dict は挿入順を保持するため、最後に参照した一覧を末尾に入れ直して LRU とする
+_page_cache = {}
+
+
+class InvalidParameterError(Exception):
+    pass
 
 
 def handler(event, context):
     status_code = HTTPStatus.OK
     TABLE_NAME = os.environ["TABLE_NAME"]
-    table = dynamoDB.Table(TABLE_NAME)
+    table = aws_clients.table(TABLE_NAME)
 
     # HTTP Method のチェック
     if event["httpMethod"] != HTTPMethod.GET:
         status_code = HTTPStatus.METHOD_NOT_ALLOWED
-        return {
-            "statusCode": status_code,
-            "headers": {"Content-Type": "text/plain"},
-        }
+        return response(status_code, event=event, content_type="text/plain")
 
-    items = []
-    for status in DEFAULT_STATUSES:
-        res = query_db(table, DEFAULT_LIMIT, status)
-        items.extend(res)
+    # Query Parameter のチェック
+    # limit      : 1 回に返すアラートの最大件数(1 から MAX_LIMIT まで)
+    # status     : 取得するステータス。カンマ区切りで複数指定できる(例: OPEN,CLOSE)
+    # severity   : 重要度。カンマ区切りで複数指定できる(例: HIGH,MEDIUM)
+    # category   : カテゴリ
+    # from, to   : openedAt の範囲(ISO 8601 形式。両端を含む)
+    # fields     : 返す属性。カンマ区切りで指定する。all の場合はすべての属性を返す(デフォルトは LIST_FIELDS)
+    # next_token : 前回のレスポンスの X-Next-Token ヘッダーの値。続きのアラートを返す
+    params = event.get("queryStringParameters") or {}
+    try:
+        limit, alert_query, fields, cursors = parse_query(params)
+    except InvalidParameterError as e:
+        return response(
+            HTTPStatus.BAD_REQUEST, str(e), event, content_type="text/plain"
+        )
+
+    # アラートテーブルのバージョンが安定していれば、バージョンとクエリから ETag を作成する。
+    # クライアントが持っている一覧と同じ場合はクエリせずに 304 を返し、
+    # コンテナ内に同じ一覧があればクエリせずにキャッシュから返す
+    version = read_version()
+    if version is not None:
+        import json
+
+        cache_key = (
+            version,
+            limit,
+            json.dumps(alert_query, sort_keys=True),
+            None if fields is None else tuple(fields),
+            params.get("next_token"),
+        )
+        etag = make_etag(*cache_key)
+        if is_not_modified(event, etag):
+            return not_modified(etag, {"Access-Control-Expose-Headers": EXPOSE_HEADERS})
+        page = cached_page(cache_key)
+        if page is None:
+            page = build_page(table, limit, alert_query, fields, cursors)
+            remember_page(cache_key, page)
+        status_code, body, headers = page
+        return response(status_code, body, event, headers, etag=etag)
+
+    status_code, items, headers = query_page(table, limit, alert_query, fields, cursors)
+
+    # バージョンを使わない場合は、返すアラートの内容から ETag を作成する。
+    # クライアントが持っている一覧と同じ場合は、JSON への変換や圧縮をせずに 304 を返す
+    etag = make_etag(int(status_code), items, headers.get(NEXT_TOKEN_HEADER))
+    if is_not_modified(event, etag):
+        return not_modified(etag, headers)
+
+    return response(status_code, items, event, headers, etag=etag)
+
+
+def query_page(
+    table, limit: int, alert_query: dict, fields: list | None, cursors: dict
+) -> tuple[int, list, dict]:
+    items = query_alerts(table, limit, alert_query, fields, cursors)
+    # コンパクト形式で保存されたアラートを展開し、指定された属性だけを返す
+    items = [
+        select_fields(item, fields)
+        for item in decode_many(items, catalog_from_env())
+    ]
 
+    status_code = HTTPStatus.OK
     if len(items) == 0:
         status_code = HTTPStatus.UNPROCESSABLE_ENTITY
 
+    headers = {"Access-Control-Expose-Headers": EXPOSE_HEADERS}
+    next_token = encode_next_token(alert_query, cursors)
+    if next_token is not None:
+        headers[NEXT_TOKEN_HEADER] = next_token
+    return int(status_code), items, headers
+
+
+def build_page(
+    table, limit: int, alert_query: dict, fields: list | None, cursors: dict
+) -> tuple[int, str, dict]:
+    # キャッシュするため、一覧を JSON に変換しておく
+    status_code, items, headers = query_page(table, limit, alert_query, fields, cursors)
+    return status_code, dumps(items).decode("utf-8"), headers
+
+
+def cached_page(cache_key: tuple) -> tuple | None:
+    page = _page_cache.pop(cache_key, None)
+    if page is not None:
+        _page_cache[cache_key] = page
+    return page
+
+
+def remember_page(cache_key: tuple, page: tuple):
+    if PAGE_CACHE_SIZE <= 0:
+        return
+    # 古いバージョンの一覧は参照されなくなるため、LRU で追い出される
+    _page_cache.pop(cache_key, None)
+    _page_cache[cache_key] = page
+    while len(_page_cache) > PAGE_CACHE_SIZE:
+        del _page_cache[next(iter(_page_cache))]
+
+
+def build_streams(alert_query: dict) -> list[dict]:
+    # アラートを取得するクエリの単位(ストリーム)。各ストリームは openedAt の新しい順にアラートを返す。
+    # category を指定し、カテゴリのインデックスがある場合はそのインデックスを 1 回クエリし、
+    # ステータスはフィルターで絞り込む。
+    # それ以外の場合は status-index をステータスごとにクエリする(category はフィルターで絞り込む)。
+    if alert_query["category"] and CATEGORY_INDEX_NAME:
+        return [
+            {
+                "name": "category",
+                "index": CATEGORY_INDEX_NAME,
+                "partition": ("category", alert_query["category"]),
+                "statuses": alert_query["statuses"],
+            }
+        ]
+    return [
+        {
+            "name": status,
+            "index": "status-index",
+            "partition": ("status", status),
+            "statuses": None,
+        }
+        for status in alert_query["statuses"]
+    ]
+
+
+def query_alerts(
+    table, limit: int, alert_query: dict, fields: list | None, cursors: dict
+) -> list:
+    # ストリームごとのクエリを並列に実行し、openedAt の新しい順に k-way マージして limit 件を返す。
+    # 各ストリームのクエリは limit 件(または最後)まで取得するため、
+    # マージ結果の先頭 limit 件は全体でも新しい順の先頭となる。
+    # cursors は返したアラートの続きから取得できるように更新する。
+    import heapq
+
+    streams = [
+        stream
+        for stream in build_streams(alert_query)
+        if not (stream["name"] in cursors and cursors[stream["name"]] is None)
+    ]
+
+    def query_stream(stream):
+        return query_db(
+            table, limit, stream, alert_query, cursors.get(stream["name"]), fields
+        )
+
+    if len(streams) <= 1:
+        results = [query_stream(stream) for stream in streams]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=len(streams)) as executor:
+            results = list(executor.map(query_stream, streams))
+
+    def tagged(name, res):
+        for position, item in enumerate(res):
+            yield item.get("openedAt", ""), name, position, item
+
+    merged = heapq.merge(
+        *(tagged(stream["name"], res) for stream, (res, _) in zip(streams, results)),
+        key=lambda entry: entry[0],
+        reverse=True,
+    )
+    items = []
+    consumed = {}
+    for _, name, position, item in islice(merged, limit):
+        items.append(item)
+        consumed[name] = position + 1
+
+    for stream, (res, last_evaluated_key) in zip(streams, results):
+        count = consumed.get(stream["name"], 0)
+        if count == len(res):
+            # 取得したアラートをすべて返した場合は、クエリの続きから取得する
+            cursors[stream["name"]] = last_evaluated_key
+        elif count > 0:
+            # 一部だけ返した場合は、最後に返したアラートの次から取得する
+            cursors[stream["name"]] = index_key(stream, res[count - 1])
+    return items
+
+
+def index_key(stream: dict, item: dict) -> dict:
+    # インデックスの ExclusiveStartKey(テーブルのキーとインデックスのキー)
+    partition_key = stream["partition"][0]
     return {
-        "statusCode": status_code,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-        },
-        "body": json.dumps(items),
+        "id": item["id"],
+        partition_key: item[partition_key],
+        "openedAt": item["openedAt"],
     }
 
 
-def query_db(table, limit: int, status: type_status) -> list:
-    """Get alerts from DynamoDB."""
+def parse_query(params: dict) -> tuple[int, dict, list | None, dict]:
+    try:
+        limit = int(params.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise InvalidParameterError("limit must be an integer")
+    if limit < 1 or limit > MAX_LIMIT:
+        raise InvalidParameterError("limit must be between 1 and {}".format(MAX_LIMIT))
+
+    statuses = DEFAULT_STATUSES
+    if params.get("status"):
+        statuses = split_values(params["status"])
+        for status in statuses:
+            if status not in ALLOWED_STATUSES:
+                raise InvalidParameterError("Unknown status: {}".format(status))
+
+    severities = []
+    if params.get("severity"):
+        severities = split_values(params["severity"])
+        for severity in severities:
+            if severity not in ALLOWED_SEVERITIES:
+                raise InvalidParameterError("Unknown severity: {}".format(severity))
+
+    try:
+        fields = parse_fields(params.get("fields"), LIST_FIELDS)
+    except ValueError as e:
+        raise InvalidParameterError(str(e))
+
+    opened_from = parse_timestamp(params.get("from"), "from")
+    opened_to = parse_timestamp(params.get("to"), "to")
+    if opened_from and opened_to and opened_from > opened_to:
+        raise InvalidParameterError("from must be earlier than to")
+
+    alert_query = {
+        "statuses": statuses,
+        "severities": severities,
+        "category": params.get("category") or None,
+        "from": opened_from,
+        "to": opened_to,
+    }
+    cursors = {}
+    if params.get("next_token"):
+        cursors = decode_next_token(params["next_token"], alert_query)
+    return limit, alert_query, fields, cursors
+
+
+def split_values(value: str) -> list:
+    return list(dict.fromkeys(v.strip().upper() for v in value.split(",") if v.strip()))
+
+
+def parse_timestamp(value: str | None, name: str) -> str | None:
+    # openedAt と文字列で比較するため、UTC の ISO 8601 形式(例: 2024-04-11T06:20:01.648000Z)に揃える
+    if not value:
+        return None
+    from datetime import datetime, timezone
+
     try:
-        response = table.query(
-            IndexName="status-index",
-            KeyConditionExpression=Key("status").eq(status),
-            Limit=int(limit),
-            ScanIndexForward=False,
+        timestamp = datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidParameterError("{} must be an ISO 8601 timestamp".format(name))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def encode_next_token(alert_query: dict, cursors: dict) -> str | None:
+    # ストリームごとの LastEvaluatedKey を、クライアントからは中身の分からない文字列にする。
+    # cursors の値が None のストリームは取得し終えている。cursors にないストリームはまだ取得していない。
+    # すべてのストリームを取得し終えた場合は None を返す。
+    if all(
+        stream["name"] in cursors and cursors[stream["name"]] is None
+        for stream in build_streams(alert_query)
+    ):
+        return None
+    import base64
+    import json
+
+    token = {"query": alert_query, "cursors": cursors}
+    return base64.urlsafe_b64encode(json.dumps(token, default=str).encode()).decode()
+
+
+def decode_next_token(next_token: str, alert_query: dict) -> dict:
+    import base64
+    import json
+
+    try:
+        token = json.loads(base64.urlsafe_b64decode(next_token.encode()))
+        cursors = token["cursors"]
+        token_query = token["query"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidParameterError("next_token is invalid")
+    # 続きを取得する場合は、最初のリクエストと同じ条件を指定する必要がある
+    if token_query != alert_query:
+        raise InvalidParameterError("next_token does not match the query parameters")
+    return cursors
+
+
+def query_db(
+    table,
+    limit: int,
+    stream: dict,
+    alert_query: dict,
+    exclusive_start_key: dict | None = None,
+    fields: list | None = None,
+) -> tuple[list, dict | None]:
+    """Get alerts from DynamoDB."""
+    from boto3.dynamodb.conditions import Attr, Key
+
+    # openedAt の範囲はインデックスのソートキーの条件として指定する
+    partition_key, partition_value = stream["partition"]
+    key_condition = Key(partition_key).eq(partition_value)
+    if alert_query["from"] and alert_query["to"]:
+        key_condition &= Key("openedAt").between(alert_query["from"], alert_query["to"])
+    elif alert_query["from"]:
+        key_condition &= Key("openedAt").gte(alert_query["from"])
+    elif alert_query["to"]:
+        key_condition &= Key("openedAt").lte(alert_query["to"])
+
+    # キーで絞り込めない条件だけをフィルターとする
+    filters = []
+    if stream["statuses"]:
+        filters.append(Attr("status").is_in(stream["statuses"]))
+    if alert_query["category"] and partition_key != "category":
+        filters.append(Attr("category").eq(alert_query["category"]))
+    if alert_query["severities"]:
+        filters.append(Attr("severity").is_in(alert_query["severities"]))
+    filter_expression = None
+    for condition in filters:
+        filter_expression = (
+            condition if filter_expression is None else filter_expression & condition
         )
-        items = response["Items"]
-        return items
+
+    try:
+        items = []
+        while True:
+            kwargs = {
+                "IndexName": stream["index"],
+                "KeyConditionExpression": key_condition,
+                "Limit": int(limit - len(items)),
+                "ScanIndexForward": False,
+            }
+            if filter_expression is not None:
+                kwargs["FilterExpression"] = filter_expression
+            # 会話履歴など大きな属性を読み込まないよう、必要な属性だけを読み込む
+            if fields is not None:
+                kwargs.update(projection(fields, REQUIRED_FIELDS))
+            if exclusive_start_key is not None:
+                kwargs["ExclusiveStartKey"] = exclusive_start_key
+            # 複数のスレッドから呼び出すため、スレッドセーフなクライアントでクエリする。
+            # Table リソースのクライアントは Key や値の型の変換を Table と同様に行う。
+            response = table.meta.client.query(TableName=table.name, **kwargs)
+            items.extend(response["Items"])
+            exclusive_start_key = response.get("LastEvaluatedKey")
+            # フィルターで除かれて limit 件に満たない場合は、続きを取得する
+            if exclusive_start_key is None or len(items) >= limit:
+                return items, exclusive_start_key
     except Exception as e:
         print(e)
         raise e
@@ -1,15 +1,13 @@
 import os
-import uuid
 
-import boto3
-
-dynamoDB = boto3.resource("dynamodb")
+import aws_clients
+from alert_version import bump_version
 
 
 def handler(event, context):
     try:
         TABLE_NAME = os.environ["TABLE_NAME"]
-        table = dynamoDB.Table(TABLE_NAME)
+        table = aws_clients.table(TABLE_NAME)
         update_table(table)
 
     except Exception as e:
@@ -21,6 +19,8 @@ def update_table(table):
     print("initial_data is {}".format(initial_data))
     for item in initial_data:
         table.put_item(Item=item)
+    # アラートの一覧のキャッシュを無効にする
+    bump_version()
 
 
 def set_initial_data():
@@ -1,64 +1,62 @@
-import json
 import os
 from http import HTTPMethod, HTTPStatus
 
-import boto3
-from boto3.dynamodb.conditions import Key
-
-dynamoDB = boto3.resource("dynamodb")
+import aws_clients
+from alert_codec import DEFAULT_FIELDS, is_compact
+from alert_version import bump_version
+from http_response import parse_body, response
 
 
 def handler(event, context):
     try:
         status_code = HTTPStatus.OK
         TABLE_NAME = os.environ["TABLE_NAME"]
-        table = dynamoDB.Table(TABLE_NAME)
+        table = aws_clients.table(TABLE_NAME)
         # HTTP Method のチェック
         if event["httpMethod"] != HTTPMethod.PUT:
             status_code = HTTPStatus.METHOD_NOT_ALLOWED
-            return {
-                "statusCode": status_code,
-                "headers": {"Content-Type": "text/plain"},
-            }
+            return response(status_code, event=event, content_type="text/plain")
 
-        body = json.loads(event["body"])
+        body = parse_body(event)
         alert_id = event.get("pathParameters").get("alert_id")
 
         # DynamoDBに該当列があるか確認
-        if check_column(table, alert_id):
-            response, status_code = update_column(table, alert_id, body)
+        item = check_column(table, alert_id)
+        if item is not None:
+            updated, status_code = update_column(
+                table, alert_id, body, is_compact(item)
+            )
+            # アラートの一覧のキャッシュを無効にする
+            bump_version()
         else:
             # なければ404を返す
             status_code = HTTPStatus.NOT_FOUND
-            response = {}
-
-        return {
-            "statusCode": status_code,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-            },
-            "body": json.dumps(response),
-        }
+            updated = {}
+
+        return response(status_code, updated, event)
     except Exception as e:
         print(e)
         raise e
 
 
-def check_column(table, alert_id):
+def check_column(table, alert_id) -> dict | None:
+    from boto3.dynamodb.conditions import Key
+
     response = table.query(KeyConditionExpression=Key("id").eq(alert_id))
 
     if len(response["Items"]) == 0:
-        return False
+        return None
     else:
-        return True
+        return response["Items"][0]
 
 
-def update_column(table, alert_id, body):
+def update_column(table, alert_id, body, compact: bool = False):
     try:
         updateExpression = ""
         attr_names = {}
         attr_values = {}
+        # コンパクト形式のアラートでは、デフォルト値に戻す属性は削除して省略したままにする
+        removed_names = []
 
         update_fields = [
             ("status", "status"),
@@ -68,21 +66,32 @@ def update_column(table, alert_id, body):
         ]
 
         for field, attr_name in update_fields:
-            if body.get(field) is not None:
-                if updateExpression:
-                    updateExpression += ", "
-                else:
-                    updateExpression += "set "
-                updateExpression += f"#{attr_name} = :{attr_name}"
+            if body.get(field) is None:
+                continue
+            default = DEFAULT_FIELDS.get(attr_name)
+            if compact and default is not None and body.get(field) == default():
                 attr_names[f"#{attr_name}"] = attr_name
-                attr_values[f":{attr_name}"] = body.get(field)
-
-        response_ddb = table.update_item(
-            Key={"id": alert_id},
-            UpdateExpression=updateExpression,
-            ExpressionAttributeNames=attr_names,
-            ExpressionAttributeValues=attr_values,
-        )
+                removed_names.append(f"#{attr_name}")
+                continue
+            if updateExpression:
+                updateExpression += ", "
+            else:
+                updateExpression += "set "
+            updateExpression += f"#{attr_name} = :{attr_name}"
+            attr_names[f"#{attr_name}"] = attr_name
+            attr_values[f":{attr_name}"] = body.get(field)
+
+        if removed_names:
+            updateExpression += " remove " + ", ".join(removed_names)
+
+        update_kwargs = {
+            "Key": {"id": alert_id},
+            "UpdateExpression": updateExpression.strip(),
+            "ExpressionAttributeNames": attr_names,
+        }
+        if attr_values:
+            update_kwargs["ExpressionAttributeValues"] = attr_values
+        response_ddb = table.update_item(**update_kwargs)
 
     except Exception as e:
         print(e)
@@ -0,0 +1,37 @@
+import json
+import os
+
+import aws_clients
+from alert_summary import SUMMARY_DIMENSIONS, count_alerts, put_counts
+
+
+def handler(event, context):
+    # アラートテーブル全体をスキャンして、アラートの件数を作り直す。
+    # 件数がずれた場合に手動で実行する(例: aws lambda invoke --function-name <関数名> out.json)。
+    # スキャン中に更新されたアラートの増減は反映されないことがあるため、書き込みが少ないときに実行する
+    try:
+        TABLE_NAME = os.environ["TABLE_NAME"]
+        SUMMARY_TABLE_NAME = os.environ["SUMMARY_TABLE_NAME"]
+
+        counts = count_alerts(scan_alerts(aws_clients.table(TABLE_NAME)))
+        put_counts(aws_clients.table(SUMMARY_TABLE_NAME), counts)
+        print("rebuilt alert summary: {}".format(json.dumps(counts, ensure_ascii=False)))
+        return counts
+    except Exception as e:
+        print(e)
+        raise e
+
+
+def scan_alerts(table):
+    # 件数に必要な属性だけを読み込み、ページごとに返す
+    attributes = ("status", *SUMMARY_DIMENSIONS)
+    kwargs = {
+        "ProjectionExpression": ", ".join("#" + name for name in attributes),
+        "ExpressionAttributeNames": {"#" + name: name for name in attributes},
+    }
+    while True:
+        response = table.scan(**kwargs)
+        yield from response["Items"]
+        if "LastEvaluatedKey" not in response:
+            break
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
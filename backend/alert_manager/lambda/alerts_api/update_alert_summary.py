@@ -0,0 +1,84 @@
+import os
+from datetime import datetime, timezone
+
+import aws_clients
+from alert_summary import (
+    RECORD_MAX_COUNTERS,
+    SUMMARY_DIMENSIONS,
+    UPDATE_MAX_COUNTERS,
+    apply_deltas,
+    counter_deltas,
+    format_timestamp,
+)
+from alert_version import bump_version
+
+
+def handler(event, context):
+    # アラートテーブルの DynamoDB Streams のレコードから、アラートの件数を更新する。
+    # 増減はレコードのまとまりごとに、1 回の書き込みで反映する。
+    # 途中のまとまりで失敗した場合やタイムアウトした場合はバッチ全体が再実行されるが、
+    # 反映済みのまとまりは同じ ClientRequestToken で書き込むため、10 分以内の再実行では二重に反映されない。
+    # 10 分を過ぎた再実行や、バッチの分け方が変わった再実行では二重に反映されることがあるため、
+    # 件数がずれた場合は rebuild_alert_summary.py(スタックの出力の関数)を実行して作り直す
+    try:
+        SUMMARY_TABLE_NAME = os.environ["SUMMARY_TABLE_NAME"]
+        table = aws_clients.table(SUMMARY_TABLE_NAME)
+
+        records = event.get("Records", [])
+        updated = 0
+        for group in record_groups(records):
+            deltas = {}
+            for record in group:
+                images = record.get("dynamodb", {})
+                counter_deltas(
+                    summary_fields(images.get("OldImage")),
+                    summary_fields(images.get("NewImage")),
+                    deltas,
+                )
+            updated += apply_deltas(
+                table, deltas, request_token(group), updated_at(group)
+            )
+        # NestJS の API など、バージョンを更新しない書き込みもアラートの一覧のキャッシュに反映する
+        if records:
+            bump_version(table)
+        print("records: {}, updated counters: {}".format(len(records), updated))
+    except Exception as e:
+        print(e)
+        raise e
+
+
+def record_groups(records: list):
+    # 1 回の書き込みで更新する属性の数が UPDATE_MAX_COUNTERS を超えないように、レコードを先頭から分ける。
+    # 再実行で同じバッチが届いた場合に同じまとまりとなるよう、レコードの内容によらず件数だけで分ける
+    size = UPDATE_MAX_COUNTERS // RECORD_MAX_COUNTERS
+    for start in range(0, len(records), size):
+        yield records[start : start + size]
+
+
+def request_token(group: list) -> str:
+    # まとまりに含まれるレコードの eventID から、ClientRequestToken(36 文字以内)を作る
+    import hashlib
+
+    return hashlib.blake2b(
+        "|".join(record["eventID"] for record in group).encode(), digest_size=18
+    ).hexdigest()
+
+
+def updated_at(group: list) -> str:
+    # 再実行でも同じ値となるよう、現在時刻ではなくレコードの作成時刻を使う
+    created = max(
+        record.get("dynamodb", {}).get("ApproximateCreationDateTime", 0)
+        for record in group
+    )
+    return format_timestamp(datetime.fromtimestamp(float(created), timezone.utc))
+
+
+def summary_fields(image: dict | None) -> dict | None:
+    # ストリームのイメージ(型付きの値)から、件数に必要な文字列の属性だけを取り出す
+    if image is None:
+        return None
+    return {
+        name: image[name]["S"]
+        for name in ("status", *SUMMARY_DIMENSIONS)
+        if "S" in image.get(name, {})
+    }
@@ -0,0 +1,152 @@
+import os
+
+# アラートの項目を DynamoDB に保存する形式(コンパクト形式)と、API で返す形式(展開形式)を相互に変換するモジュール。
+# 展開形式のアラートには空の属性や、エラーコードテーブルと同じ文言が含まれている。
+# コンパクト形式では以下を省略して項目を小さくし、読み書きの容量ユニットを減らす。
+#   - 値がデフォルト値(空文字列や空のリストなど)の属性
+#   - エラーコードテーブルの文言(detail, name, description)。代わりに error_code を保存し、読み込み時に参照する
+# コンパクト形式の項目には encoding 属性を付ける。encoding 属性がない項目は従来の形式としてそのまま返す。
+#
+# ALERT_ENCODING 環境変数で書き込み時の形式を切り替える。
+#   full    : 従来の形式で保存する(デフォルト)
+#   compact : コンパクト形式で保存する
+# NestJS の API(backend/common)はアラートテーブルを直接読み込むため、
+# compact にする場合は Python の API からだけアラートを参照する構成にすること。
+
+ALERT_ENCODING = os.environ.get("ALERT_ENCODING", "full")
+COMPACT_ENCODING = "compact"
+
+# 省略する属性とそのデフォルト値。読み込み時はデフォルト値で補う。
+# リストや辞書は読み込みごとに新しく作成する
+DEFAULT_FIELDS = {
+    "closedAt": lambda: "",
+    "closedBy": lambda: "",
+    "comment": lambda: "",
+    "conversation_id": lambda: "",
+    "conversation": lambda: {"messages": []},
+    "meetingIds": lambda: [],
+}
+# エラーコードテーブルから参照する属性
+CATALOG_FIELDS = ("detail", "name", "description")
+# アラートの属性。API の fields パラメーターで指定できる
+ALERT_FIELDS = (
+    "id",
+    "openedAt",
+    "closedAt",
+    "status",
+    "severity",
+    "category",
+    "detail",
+    "name",
+    "description",
+    "closedBy",
+    "comment",
+    "conversation_id",
+    "conversation",
+    "meetingIds",
+    "error_code",
+    "gatewayId",
+)
+
+
+def encode(alert: dict, encoding: str | None = None) -> dict:
+    # アラートを保存する形式に変換する
+    encoding = encoding or ALERT_ENCODING
+    if encoding != COMPACT_ENCODING:
+        return alert
+
+    item = {"encoding": COMPACT_ENCODING}
+    for key, value in alert.items():
+        default = DEFAULT_FIELDS.get(key)
+        if default is not None and value == default():
+            continue
+        # error_code があれば文言はエラーコードテーブルから参照できる
+        if key in CATALOG_FIELDS and "error_code" in alert:
+            continue
+        item[key] = value
+    return item
+
+
+def is_compact(item: dict) -> bool:
+    return item.get("encoding") == COMPACT_ENCODING
+
+
+def decode(item: dict, error_infos: dict | None = None) -> dict:
+    # 保存されている項目を展開形式に変換する。
+    # error_infos はエラーコードごとのエラー情報({エラーコード: エラー情報})
+    if not is_compact(item):
+        return item
+
+    alert = {key: default() for key, default in DEFAULT_FIELDS.items()}
+    alert.update(item)
+    del alert["encoding"]
+    error_info = (error_infos or {}).get(str(item.get("error_code")))
+    if "detail" not in alert:
+        alert["detail"] = (
+            error_info["alert_detail"] + "\n" + error_info["invoke_condition"]
+            if error_info
+            else ""
+        )
+    if "name" not in alert:
+        alert["name"] = error_info["tag_name"] if error_info else ""
+    if "description" not in alert:
+        alert["description"] = error_info["tag_description"] if error_info else ""
+    return alert
+
+
+def decode_many(items: list, catalog=None) -> list:
+    # 複数の項目をまとめて展開する。
+    # catalog(error_catalog.ErrorCatalog)を指定した場合は、参照するエラー情報をまとめて取得する。
+    error_codes = [
+        item["error_code"]
+        for item in items
+        if is_compact(item) and "error_code" in item
+    ]
+    error_infos = catalog.get_many(error_codes) if catalog and error_codes else {}
+    return [decode(item, error_infos) for item in items]
+
+
+def projection(fields: list, required: tuple = ()) -> dict:
+    # fields(と内部で必要な required)の属性だけを読み込む ProjectionExpression を作成する。
+    # コンパクト形式の項目を展開できるよう、encoding と、文言を参照するための error_code も読み込む。
+    attributes = [*required, *fields, "encoding"]
+    if any(field in CATALOG_FIELDS for field in fields):
+        attributes.append("error_code")
+    attributes = list(dict.fromkeys(attributes))
+    return {
+        "ProjectionExpression": ", ".join("#f_" + attribute for attribute in attributes),
+        "ExpressionAttributeNames": {
+            "#f_" + attribute: attribute for attribute in attributes
+        },
+    }
+
+
+def select_fields(alert: dict, fields: list | None) -> dict:
+    # 展開したアラートから fields の属性だけを取り出す。fields が None の場合はすべて返す
+    if fields is None:
+        return alert
+    return {field: alert[field] for field in fields if field in alert}
+
+
+def parse_fields(value: str | None, default: list | None) -> list | None:
+    # fields パラメーター(カンマ区切り)を解釈する。"all" の場合はすべての属性(None)とする。
+    # 不明な属性がある場合は ValueError を送出する。
+    if not value:
+        return default
+    if value.strip() == "all":
+        return None
+    fields = list(dict.fromkeys(field.strip() for field in value.split(",") if field.strip()))
+    for field in fields:
+        if field not in ALERT_FIELDS:
+            raise ValueError("Unknown field: {}".format(field))
+    return fields
+
+
+def catalog_from_env():
+    # ERROR_CODE_TABLE_NAME 環境変数があれば、そのテーブルのキャッシュを返す
+    table_name = os.environ.get("ERROR_CODE_TABLE_NAME")
+    if not table_name:
+        return None
+    from error_catalog import error_catalog
+
+    return error_catalog(table_name)
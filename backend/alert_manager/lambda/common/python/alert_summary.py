@@ -0,0 +1,130 @@
+from datetime import datetime, timezone
+
+# アラートの件数(ステータスごと、ステータスと重要度ごと、ステータスとカテゴリごと)を
+# サマリーテーブルの 1 つの項目に保持するモジュール。
+# 件数は属性名を "<ステータス>#total"、"<ステータス>#severity#<重要度>"、
+# "<ステータス>#category#<カテゴリ>" とした数値の属性で、ADD でアトミックに増減する。
+# 件数はアラートテーブルの DynamoDB Streams から更新する(update_alert_summary.py)。
+# NestJS の API(backend/common)もアラートのステータスを更新・削除するため、
+# 個々の書き込み処理ではなくストリームから更新することで、すべての書き込みを反映する。
+# ストリームのレコードは再試行で重複して届くことがある。同じレコードの増減は同じ ClientRequestToken で
+# 書き込むため、10 分以内の再試行では二重に反映されない。それ以降の再試行などで件数がずれた場合は、
+# rebuild_alert_summary.py でアラートテーブル全体から作り直す。
+
+SUMMARY_ID = "alerts"
+SUMMARY_DIMENSIONS = ("severity", "category")
+# 1 回の書き込みで更新する属性の数(式の長さの上限を超えないようにする)
+UPDATE_MAX_COUNTERS = 100
+# 1 件のアラートの変更で増減する属性の最大数(変更前と変更後のそれぞれの total と各 SUMMARY_DIMENSIONS)
+RECORD_MAX_COUNTERS = 2 * (1 + len(SUMMARY_DIMENSIONS))
+
+
+def counter_names(alert: dict | None) -> list:
+    # アラートが含まれる件数の属性名
+    if not alert or not alert.get("status"):
+        return []
+    status = alert["status"]
+    names = [status + "#total"]
+    for dimension in SUMMARY_DIMENSIONS:
+        if alert.get(dimension):
+            names.append("{}#{}#{}".format(status, dimension, alert[dimension]))
+    return names
+
+
+def counter_deltas(old: dict | None, new: dict | None, deltas: dict | None = None) -> dict:
+    # 変更前のアラートと変更後のアラートから、件数の増減({属性名: 増減})を求める。
+    # 追加の場合は old、削除の場合は new を None とする
+    deltas = {} if deltas is None else deltas
+    for name in counter_names(old):
+        deltas[name] = deltas.get(name, 0) - 1
+    for name in counter_names(new):
+        deltas[name] = deltas.get(name, 0) + 1
+    return deltas
+
+
+def count_alerts(alerts) -> dict:
+    # アラートの件数を数える(作り直し用)
+    counts = {}
+    for alert in alerts:
+        counter_deltas(None, alert, counts)
+    return counts
+
+
+def apply_deltas(table, deltas: dict, request_token: str, updated_at: str) -> int:
+    # 件数を 1 回の書き込みでアトミックに増減する。増減が 0 の属性は更新しない。
+    # request_token を ClientRequestToken とした TransactWriteItems で書き込むため、
+    # 10 分以内に同じ request_token と同じ引数で呼び出した場合は、増減を再び反映せずに成功する。
+    # 引数が毎回同じになるよう、updated_at も呼び出し元のレコードから決める。
+    names = [name for name, delta in deltas.items() if delta != 0]
+    if not names:
+        return 0
+    if len(names) > UPDATE_MAX_COUNTERS:
+        raise ValueError(
+            "Too many counters in one update: {} > {}".format(
+                len(names), UPDATE_MAX_COUNTERS
+            )
+        )
+    table.meta.client.transact_write_items(
+        TransactItems=[
+            {
+                "Update": {
+                    "TableName": table.name,
+                    "Key": {"id": SUMMARY_ID},
+                    "UpdateExpression": "ADD {} SET #updatedAt = :updatedAt".format(
+                        ", ".join(f"#c{i} :c{i}" for i in range(len(names)))
+                    ),
+                    "ExpressionAttributeNames": {
+                        "#updatedAt": "updatedAt",
+                        **{f"#c{i}": name for i, name in enumerate(names)},
+                    },
+                    "ExpressionAttributeValues": {
+                        ":updatedAt": updated_at,
+                        **{f":c{i}": deltas[name] for i, name in enumerate(names)},
+                    },
+                }
+            }
+        ],
+        ClientRequestToken=request_token,
+    )
+    return len(names)
+
+
+def put_counts(table, counts: dict):
+    # 件数の項目を置き換える(作り直し用)
+    table.put_item(
+        Item={
+            "id": SUMMARY_ID,
+            "updatedAt": now(),
+            "rebuiltAt": now(),
+            **counts,
+        }
+    )
+
+
+def to_summary(item: dict | None) -> dict:
+    # サマリーテーブルの項目を API で返す形式に変換する。件数が 0 以下の値は省略する。
+    # {"statuses": {"OPEN": {"total": 3, "severity": {"HIGH": 2, ...}, "category": {...}}, ...},
+    #  "updatedAt": "..."}
+    statuses = {}
+    for name, value in (item or {}).items():
+        if "#" not in name or value <= 0:
+            continue
+        status, counter = name.split("#", 1)
+        summary = statuses.setdefault(
+            status, {"total": 0, **{dimension: {} for dimension in SUMMARY_DIMENSIONS}}
+        )
+        if counter == "total":
+            summary["total"] = int(value)
+        else:
+            dimension, key = counter.split("#", 1)
+            if dimension in summary:
+                summary[dimension][key] = int(value)
+    return {"statuses": statuses, "updatedAt": (item or {}).get("updatedAt")}
+
+
+def now() -> str:
+    return format_timestamp(datetime.now(timezone.utc))
+
+
+def format_timestamp(timestamp: datetime) -> str:
+    return timestamp.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
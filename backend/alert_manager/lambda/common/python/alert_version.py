@@ -0,0 +1,66 @@
+import os
+import time
+
+import aws_clients
+
+# アラートテーブル全体のバージョン(書き込みのたびに増える番号)を扱うモジュール。
+# バージョンはサマリーテーブル(SUMMARY_TABLE_NAME)の "version" 項目に保持する。
+# アラートを書き込む処理は書き込み後に bump_version を呼び出す。
+# NestJS の API(backend/common)による書き込みは、update_alert_summary.py がストリームから反映する。
+# get_alerts はバージョンが変わっていなければ、前回と同じ一覧をキャッシュから返す。
+#
+# GSI の更新は結果整合性のため、バージョンが変わった直後は GSI に書き込みが反映されていないことがある。
+# 最後に変わってから SETTLE_SECONDS 秒経ったバージョンだけを「安定した」バージョンとして扱う。
+
+VERSION_ID = "version"
+SETTLE_SECONDS = float(os.environ.get("ALERT_VERSION_SETTLE_SECONDS", "2"))
+
+
+def summary_table():
+    # SUMMARY_TABLE_NAME 環境変数がなければ None を返す(バージョンを使わない)
+    table_name = os.environ.get("SUMMARY_TABLE_NAME")
+    if not table_name:
+        return None
+    return aws_clients.table(table_name)
+
+
+def bump_version(table=None) -> int | None:
+    # バージョンを 1 つ増やす。
+    # 失敗してもアラートの書き込み自体は成功しているため、例外は送出しない
+    # (ストリームからの更新でいずれバージョンが増える)
+    table = table or summary_table()
+    if table is None:
+        return None
+    try:
+        response = table.update_item(
+            Key={"id": VERSION_ID},
+            UpdateExpression="ADD #version :one SET #updatedAt = :updatedAt",
+            ExpressionAttributeNames={"#version": "version", "#updatedAt": "updatedAt"},
+            ExpressionAttributeValues={":one": 1, ":updatedAt": int(time.time() * 1000)},
+            ReturnValues="UPDATED_NEW",
+        )
+        return int(response["Attributes"]["version"])
+    except Exception as e:
+        print("[ERROR] Failed to bump the alert version: {}".format(e))
+        return None
+
+
+def read_version(table=None) -> int | None:
+    # 安定したバージョンを返す。
+    # バージョンが変わった直後の場合、バージョンを使わない場合、読み込みに失敗した場合は None を返す
+    table = table or summary_table()
+    if table is None:
+        return None
+    try:
+        item = table.get_item(
+            Key={"id": VERSION_ID},
+            ConsistentRead=True,
+            ProjectionExpression="#version, #updatedAt",
+            ExpressionAttributeNames={"#version": "version", "#updatedAt": "updatedAt"},
+        ).get("Item") or {"version": 0, "updatedAt": 0}
+    except Exception as e:
+        print("[ERROR] Failed to read the alert version: {}".format(e))
+        return None
+    if time.time() * 1000 - int(item["updatedAt"]) < SETTLE_SECONDS * 1000:
+        return None
+    return int(item["version"])
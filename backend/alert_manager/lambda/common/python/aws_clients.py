@@ -0,0 +1,47 @@
+import threading
+
+# boto3 のクライアント / リソースを初回利用時に作成して使い回すためのモジュール。
+# boto3 の import やクライアントの作成はコールドスタート時間の大部分を占めるため、
+# モジュールの import 時には行わず、実際に AWS の API を呼び出すときまで遅延させる。
+# 作成したクライアントはウォームスタート時に再利用される。
+
+_lock = threading.Lock()
+_clients = {}
+_resources = {}
+_tables = {}
+
+
+def client(service_name: str, config=None):
+    # 呼び出しごとに作成された Config でも、同じ内容であれば同じクライアントを返す
+    key = (service_name, _config_key(config))
+    if key not in _clients:
+        with _lock:
+            if key not in _clients:
+                import boto3
+
+                _clients[key] = boto3.client(service_name, config=config)
+    return _clients[key]
+
+
+def _config_key(config) -> str | None:
+    # botocore の Config はハッシュ可能でないため、設定値の repr をキーとする
+    if config is None:
+        return None
+    return repr(sorted(vars(config).items()))
+
+
+def resource(service_name: str):
+    if service_name not in _resources:
+        with _lock:
+            if service_name not in _resources:
+                import boto3
+
+                _resources[service_name] = boto3.resource(service_name)
+    return _resources[service_name]
+
+
+def table(table_name: str):
+    # DynamoDB の Table リソース
+    if table_name not in _tables:
+        _tables[table_name] = resource("dynamodb").Table(table_name)
+    return _tables[table_name]
@@ -0,0 +1,194 @@
+import os
+import random
+import threading
+import time
+
+import aws_clients
+
+# エラーコードテーブルの内容を Lambda コンテナのメモリ上にキャッシュするモジュール。
+# アラートの登録に必要なエラー情報はほとんど変更されないため、アラートごとにテーブルを参照せず、
+# 初回利用時にテーブル全体を 1 回のスキャン(ページング)で読み込んで使い回す。
+#   ERROR_CATALOG_TTL_SECONDS          : テーブル全体を読み込み直す間隔(秒)
+#   ERROR_CATALOG_NEGATIVE_TTL_SECONDS : テーブルに存在しないエラーコードを、存在しないものとして覚えておく時間(秒)
+# キャッシュにないエラーコードは、読み込み後に追加された可能性があるため 1 回だけテーブルを参照する。
+# それでも存在しない場合は一定時間、テーブルを参照せずに存在しないものとして扱う。
+# 複数のエラーコードをまとめて参照する場合は、キャッシュにないエラーコードを BatchGetItem でまとめて参照する。
+
+CATALOG_TTL_SECONDS = float(os.environ.get("ERROR_CATALOG_TTL_SECONDS", "300"))
+NEGATIVE_TTL_SECONDS = float(os.environ.get("ERROR_CATALOG_NEGATIVE_TTL_SECONDS", "60"))
+
+# BatchGetItem で 1 回に参照できるキーの数
+BATCH_GET_MAX_KEYS = 100
+BATCH_GET_MAX_RETRIES = 5
+
+# アラートの登録に利用する属性
+CATALOG_ATTRIBUTES = (
+    "error_code",
+    "severity",
+    "category",
+    "alert_detail",
+    "invoke_condition",
+    "tag_name",
+    "tag_description",
+)
+
+
+def projection() -> dict:
+    # CATALOG_ATTRIBUTES だけを読み込む。予約語と重ならないよう属性名はすべてプレースホルダーにする
+    return {
+        "ProjectionExpression": ", ".join(
+            "#" + attribute for attribute in CATALOG_ATTRIBUTES
+        ),
+        "ExpressionAttributeNames": {
+            "#" + attribute: attribute for attribute in CATALOG_ATTRIBUTES
+        },
+    }
+
+
+class ErrorCatalog:
+    """In-container cache of the error code table."""
+
+    def __init__(
+        self,
+        table_name: str,
+        ttl_seconds: float = CATALOG_TTL_SECONDS,
+        negative_ttl_seconds: float = NEGATIVE_TTL_SECONDS,
+    ):
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._entries = {}
+        self._missing = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "negative_hits": 0, "loads": 0}
+
+    def get(self, error_code: str) -> dict:
+        # エラーコードのエラー情報を返す。存在しない場合は IndexError を送出する。
+        error_code = str(error_code)
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at >= self.ttl_seconds:
+            self.load()
+
+        error_info = self._entries.get(error_code)
+        if error_info is not None:
+            self.stats["hits"] += 1
+            return error_info
+
+        missing_at = self._missing.get(error_code)
+        if missing_at is not None and now - missing_at < self.negative_ttl_seconds:
+            self.stats["negative_hits"] += 1
+            raise IndexError("error code {} is not in the catalog".format(error_code))
+
+        self.stats["misses"] += 1
+        error_info = self._query(error_code)
+        if error_info is None:
+            self._missing[error_code] = now
+            raise IndexError("error code {} is not in the catalog".format(error_code))
+        self._missing.pop(error_code, None)
+        self._entries[error_code] = error_info
+        return error_info
+
+    def get_many(self, error_codes) -> dict:
+        # 複数のエラーコードのエラー情報を {エラーコード: エラー情報} で返す。
+        # 存在しないエラーコードは結果に含めない。
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at >= self.ttl_seconds:
+            self.load()
+
+        found = {}
+        unknown = []
+        for error_code in dict.fromkeys(str(error_code) for error_code in error_codes):
+            error_info = self._entries.get(error_code)
+            if error_info is not None:
+                self.stats["hits"] += 1
+                found[error_code] = error_info
+                continue
+            missing_at = self._missing.get(error_code)
+            if missing_at is not None and now - missing_at < self.negative_ttl_seconds:
+                self.stats["negative_hits"] += 1
+                continue
+            self.stats["misses"] += 1
+            unknown.append(error_code)
+
+        if unknown:
+            fetched = self._batch_get(unknown)
+            for error_code in unknown:
+                error_info = fetched.get(error_code)
+                if error_info is None:
+                    self._missing[error_code] = now
+                    continue
+                self._missing.pop(error_code, None)
+                self._entries[error_code] = error_info
+                found[error_code] = error_info
+        return found
+
+    def load(self):
+        # テーブル全体をスキャンして読み込み直す
+        with self._lock:
+            table = aws_clients.table(self.table_name)
+            kwargs = projection()
+            entries = {}
+            while True:
+                response = table.scan(**kwargs)
+                for item in response["Items"]:
+                    entries[str(item["error_code"])] = item
+                if "LastEvaluatedKey" not in response:
+                    break
+                kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+            self._entries = entries
+            self._missing = {}
+            self._loaded_at = time.monotonic()
+            self.stats["loads"] += 1
+
+    def invalidate(self):
+        # 次回の参照時にテーブル全体を読み込み直す
+        self._loaded_at = None
+
+    def _batch_get(self, error_codes: list) -> dict:
+        # BatchGetItem で参照する。処理されなかったキー(UnprocessedKeys)は間隔を空けて再試行する。
+        dynamodb = aws_clients.resource("dynamodb")
+        items = {}
+        for start in range(0, len(error_codes), BATCH_GET_MAX_KEYS):
+            request_items = {
+                self.table_name: {
+                    "Keys": [
+                        {"error_code": error_code}
+                        for error_code in error_codes[start : start + BATCH_GET_MAX_KEYS]
+                    ],
+                    **projection(),
+                }
+            }
+            attempt = 0
+            while request_items:
+                response = dynamodb.batch_get_item(RequestItems=request_items)
+                for item in response["Responses"].get(self.table_name, []):
+                    items[str(item["error_code"])] = item
+                request_items = response.get("UnprocessedKeys") or {}
+                if not request_items:
+                    break
+                attempt += 1
+                if attempt > BATCH_GET_MAX_RETRIES:
+                    raise RuntimeError(
+                        "BatchGetItem did not process all keys of {}".format(self.table_name)
+                    )
+                time.sleep(random.uniform(0, min(1.0, 0.05 * 2**attempt)))
+        return items
+
+    def _query(self, error_code: str) -> dict | None:
+        from boto3.dynamodb.conditions import Key
+
+        items = aws_clients.table(self.table_name).query(
+            KeyConditionExpression=Key("error_code").eq(error_code)
+        )["Items"]
+        return items[0] if items else None
+
+
+_catalogs = {}
+
+
+def error_catalog(table_name: str) -> ErrorCatalog:
+    # テーブルごとのキャッシュをウォームスタート時に再利用する
+    if table_name not in _catalogs:
+        _catalogs[table_name] = ErrorCatalog(table_name)
+    return _catalogs[table_name]
@@ -0,0 +1,156 @@
+import os
+
+# API Gateway(Lambda プロキシ統合)へのレスポンスを作成する共通モジュール。
+#   - boto3 の Table リソースが返す Decimal を数値として JSON に変換する
+#   - orjson がインストールされていれば orjson で JSON に変換する
+#   - クライアントが Accept-Encoding: gzip を送信し、本文が RESPONSE_GZIP_MIN_BYTES を超える場合は
+#     gzip で圧縮して base64 で返す(API の binaryMediaTypes でバイナリに戻して返される)
+#   - Content-Type と CORS のヘッダーをすべてのレスポンスで揃える
+#   - ETag を付けて返し、If-None-Match が一致する場合は本文を作成せずに 304 を返す
+# 本モジュールはすべての API の Lambda 関数から import されるため、
+# json / orjson / base64 / hashlib / decimal / gzip は import 時ではなく利用時に import し、コールドスタートを短くする。
+
+GZIP_MIN_BYTES = int(os.environ.get("RESPONSE_GZIP_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+
+CORS_HEADERS = {"Access-Control-Allow-Origin": "*"}
+
+
+def _default(value):
+    from decimal import Decimal
+
+    if isinstance(value, Decimal):
+        # 整数の Decimal は int、それ以外は float とする
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(
+        "Object of type {} is not JSON serializable".format(type(value).__name__)
+    )
+
+
+# JSON への変換関数は初回に作成し、呼び出しごとに作成せず使い回す
+_dumps = None
+
+
+def dumps(value) -> bytes:
+    global _dumps
+    if _dumps is None:
+        _dumps = _make_dumps()
+    return _dumps(value)
+
+
+def _make_dumps():
+    # orjson も Decimal と set は変換できないため、json と同じく _default で変換する
+    try:
+        import orjson
+    except ImportError:
+        import json
+
+        encoder = json.JSONEncoder(
+            default=_default, ensure_ascii=False, separators=(",", ":")
+        )
+        return lambda value: encoder.encode(value).encode("utf-8")
+    return lambda value: orjson.dumps(value, default=_default)
+
+
+def request_header(event: dict | None, header_name: str) -> str | None:
+    # API Gateway のヘッダー名は大文字・小文字がクライアントによって異なる
+    if not event:
+        return None
+    header_name = header_name.lower()
+    for name, value in (event.get("headers") or {}).items():
+        if name.lower() == header_name:
+            return value
+    return None
+
+
+def accepts_gzip(event: dict | None) -> bool:
+    value = request_header(event, "Accept-Encoding")
+    return bool(value) and "gzip" in value.lower()
+
+
+def make_etag(*parts, weak: bool = False) -> str:
+    # JSON に変換するよりも軽い repr から ETag を作成する。
+    # parts にはレスポンスの本文の元になる値(またはその内容を代表する値)を渡す
+    import hashlib
+
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+    return '{}"{}"'.format("W/" if weak else "", digest)
+
+
+def is_not_modified(event: dict | None, etag: str) -> bool:
+    # If-None-Match のいずれかの ETag と一致するかどうか(弱い比較)
+    value = request_header(event, "If-None-Match")
+    if not value:
+        return False
+    if value.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque for candidate in value.split(",")
+    )
+
+
+def not_modified(etag: str, headers: dict | None = None) -> dict:
+    return {
+        "statusCode": 304,
+        "headers": {**CORS_HEADERS, **etag_headers(etag), **(headers or {})},
+    }
+
+
+def etag_headers(etag: str) -> dict:
+    # ブラウザが毎回 ETag で再検証するように no-cache とする
+    return {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+    }
+
+
+def response(
+    status_code: int,
+    body=None,
+    event: dict | None = None,
+    headers: dict | None = None,
+    content_type: str = "application/json",
+    etag: str | None = None,
+) -> dict:
+    # body が str 以外の場合は JSON に変換する。None の場合は本文を返さない
+    result = {
+        "statusCode": int(status_code),
+        "headers": {"Content-Type": content_type, **CORS_HEADERS, **(headers or {})},
+    }
+    if etag is not None:
+        result["headers"].update(etag_headers(etag))
+    if body is None:
+        return result
+
+    data = body.encode("utf-8") if isinstance(body, str) else dumps(body)
+    if len(data) > GZIP_MIN_BYTES and accepts_gzip(event):
+        import base64
+        import gzip
+
+        result["headers"]["Content-Encoding"] = "gzip"
+        result["headers"]["Vary"] = "Accept-Encoding"
+        result["body"] = base64.b64encode(
+            gzip.compress(data, compresslevel=GZIP_LEVEL)
+        ).decode("ascii")
+        result["isBase64Encoded"] = True
+    else:
+        result["body"] = data.decode("utf-8")
+    return result
+
+
+def parse_body(event: dict):
+    # リクエストの本文を JSON として読み込む。
+    # binaryMediaTypes によって base64 で渡された本文にも対応する
+    import json
+
+    body = event.get("body")
+    if body is None:
+        return {}
+    if event.get("isBase64Encoded"):
+        import base64
+
+        body = base64.b64decode(body)
+    return json.loads(body)
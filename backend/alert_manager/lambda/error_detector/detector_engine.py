@@ -0,0 +1,41 @@
+from typing import Callable
+
+from error_state import ErrorState
+
+# IoT Events の ErrorDetectorModel(cdk/lib/constructs/error-detector.ts)と同じ状態遷移を、
+# Lambda 関数の中で実行するための検知エンジン。
+# ErrorDetectorModel はエラーコードごとに以下の 2 状態を持つ。
+#   Normal        : 正常。異常(isNormal == False)を受け取ると ErrorDetected に遷移する
+#   ErrorDetected : 異常。遷移時にアラートを登録する。正常(isNormal == True)を受け取ると Normal に遷移する
+# 本エンジンではゲートウェイごとに、ErrorDetected となっているエラーコードの集合を ErrorState で保持する。
+# 状態がない場合(初めてデータを受け取った場合)は、全エラーコードが Normal であるものとする。
+# IoT Events と異なり状態は呼び出し元が保持するため、コンテナをまたいで状態を引き継げるストア
+# (STATE_STORE=dynamodb)を利用すること。メモリのストアでは、コールドスタートしたコンテナが
+# 既に ErrorDetected のエラーコードを再び検知し、同じ異常のアラートを重複して登録してしまう。
+# IoT Events の SERIAL 評価と異なり、同じゲートウェイのメッセージが同時に処理されることがあるため、
+# 呼び出し元は next_state で遷移を求めて状態を条件付きで保存し、保存できた場合にだけアラートを登録すること
+# (publish_error_topic.py)。
+
+
+class ErrorDetectorEngine:
+    def __init__(self, on_error_detected: Callable[[str, ErrorState, str], None]):
+        # on_error_detected(key, raised, timestamp) は Normal -> ErrorDetected に遷移したエラーコードごとに
+        # アラートを登録する処理
+        self.on_error_detected = on_error_detected
+
+    def transition(
+        self, state: dict | None, errors: ErrorState, timestamp: str, key: str
+    ) -> tuple[dict, ErrorState]:
+        # state(前回の状態)から errors への遷移を行い、遷移後の状態と
+        # Normal -> ErrorDetected に遷移したエラーコードを返す。
+        # アラートの登録に失敗した場合は例外を呼び出し元に送出し、状態は更新しない。
+        state, raised = self.next_state(state, errors)
+        if raised:
+            self.on_error_detected(key, raised, timestamp)
+        return state, raised
+
+    @staticmethod
+    def next_state(state: dict | None, errors: ErrorState) -> tuple[dict, ErrorState]:
+        # アラートを登録せずに、遷移後の状態と Normal -> ErrorDetected に遷移したエラーコードを返す
+        previous = state["errors"] if state is not None else ErrorState()
+        return {"errors": errors}, errors.raised(previous)
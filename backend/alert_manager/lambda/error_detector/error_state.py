@@ -0,0 +1,136 @@
+import os
+
+# 異常となっているエラーコードの集合を、整数のビット列で表現する。
+# エラーコード n が異常であれば n ビット目を 1 とする。
+# Python の整数は任意精度なので、数千のエラーコードや飛び飛びのエラーコードも扱える。
+# 1 メッセージで送信する場合などは 16 進数の文字列で表現する。
+# 例: エラーコード 1, 3 が異常 -> 0b1010 -> "a"
+
+
+def _iter_bits(bits: int):
+    # 1 となっているビットの位置を昇順に返す
+    binary = bin(bits)[:1:-1]
+    position = binary.find("1")
+    while position != -1:
+        yield position
+        position = binary.find("1", position + 1)
+
+
+class ErrorState:
+    """Set of active error codes backed by an int bitset."""
+
+    __slots__ = ("bits", "_codes")
+
+    def __init__(self, bits: int = 0):
+        self.bits = bits
+        self._codes = None
+
+    @classmethod
+    def from_codes(cls, error_codes) -> "ErrorState":
+        bits = 0
+        for error_code in error_codes:
+            bits |= 1 << int(error_code)
+        return cls(bits)
+
+    @classmethod
+    def from_hex(cls, bitmap: str | None) -> "ErrorState":
+        return cls(int(bitmap or "0", 16))
+
+    def to_hex(self) -> str:
+        return format(self.bits, "x")
+
+    def codes(self) -> frozenset[int]:
+        # 所属判定を O(1) で行うため、エラーコードの集合は初回に作成して使い回す
+        if self._codes is None:
+            self._codes = frozenset(_iter_bits(self.bits))
+        return self._codes
+
+    def __contains__(self, error_code: int) -> bool:
+        return error_code in self.codes()
+
+    def __iter__(self):
+        return _iter_bits(self.bits)
+
+    def __len__(self) -> int:
+        return self.bits.bit_count()
+
+    def __bool__(self) -> bool:
+        return self.bits != 0
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ErrorState) and self.bits == other.bits
+
+    def __hash__(self) -> int:
+        return hash(self.bits)
+
+    def __and__(self, other: "ErrorState") -> "ErrorState":
+        return ErrorState(self.bits & other.bits)
+
+    def __or__(self, other: "ErrorState") -> "ErrorState":
+        return ErrorState(self.bits | other.bits)
+
+    def __xor__(self, other: "ErrorState") -> "ErrorState":
+        return ErrorState(self.bits ^ other.bits)
+
+    def __sub__(self, other: "ErrorState") -> "ErrorState":
+        return ErrorState(self.bits & ~other.bits)
+
+    def diff(self, previous: "ErrorState") -> "ErrorState":
+        # previous から正常/異常が変化したエラーコード
+        return self ^ previous
+
+    def raised(self, previous: "ErrorState") -> "ErrorState":
+        # previous では正常で、self で異常となっているエラーコード
+        return self - previous
+
+    def cleared(self, previous: "ErrorState") -> "ErrorState":
+        # previous では異常で、self で正常となっているエラーコード
+        return previous - self
+
+    def __repr__(self) -> str:
+        return "ErrorState({})".format(sorted(self))
+
+
+class ErrorCodeRegistry:
+    """Explicit set of the error codes handled by the error detector."""
+
+    def __init__(self, error_codes):
+        self.error_codes = sorted({int(error_code) for error_code in error_codes})
+        self.mask = ErrorState.from_codes(self.error_codes)
+
+    @classmethod
+    def from_env(cls) -> "ErrorCodeRegistry":
+        # ERROR_CODES 環境変数でエラーコードを指定する。カンマ区切りで範囲も指定できる。
+        # 例: "1-90,100,2000-2999"
+        # 指定がない場合は従来どおり 1 から MAX_ERROR_ID までのエラーコードとする。
+        spec = os.environ.get("ERROR_CODES")
+        if not spec:
+            return cls(range(1, int(os.environ["MAX_ERROR_ID"]) + 1))
+        return cls.from_spec(spec)
+
+    @classmethod
+    def from_spec(cls, spec: str) -> "ErrorCodeRegistry":
+        error_codes = []
+        for part in spec.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            if "-" in part:
+                start, end = part.split("-", 1)
+                error_codes.extend(range(int(start), int(end) + 1))
+            else:
+                error_codes.append(int(part))
+        return cls(error_codes)
+
+    def state(self, error_codes) -> ErrorState:
+        # 登録されていないエラーコードは無視する
+        return ErrorState.from_codes(error_codes) & self.mask
+
+    def __contains__(self, error_code: int) -> bool:
+        return error_code in self.mask
+
+    def __iter__(self):
+        return iter(self.error_codes)
+
+    def __len__(self) -> int:
+        return len(self.error_codes)
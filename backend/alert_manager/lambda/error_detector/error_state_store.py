@@ -0,0 +1,171 @@
+import os
+import time
+from decimal import Decimal
+
+import aws_clients
+from error_state import ErrorState
+
+# 各エラーコードの最後に送信した正常/異常の状態を保持するストア。
+# 差分送信モードでは、前回の状態と今回の状態を比較して変化したエラーコードだけを送信する。
+# 状態は {"errors": ErrorState, "synced_at": float} の形で扱う。
+#   errors    : 異常となっているエラーコードの集合
+#   synced_at : 最後に全エラーコードを送信(フル同期)した UNIX 時刻
+# ヒステリシスの状態も同じストアに保存する。その場合は synced_at の代わりに pending を持つ。
+#   pending   : {エラーコード: (切り替わり始めた時刻, 連続回数)}
+# 保存した状態には以下も持たせる。
+#   version   : 保存するたびに 1 ずつ増える番号
+#   timestamp : 最後に反映したメッセージの時刻(UTC)
+#
+# 同じゲートウェイのメッセージは複数の呼び出しで同時に処理されることがある
+# (IoT ルールからの非同期呼び出しや、標準キューのバッチを並行して処理する場合)。
+# 読み込んだ後に別の呼び出しが保存していた場合は上書きせず、読み込み直して処理し直す(update_state)。
+# また、保存されている時刻以前のメッセージは反映済みか、後から届いた古いメッセージのため読み飛ばす。
+
+# 保存が他の呼び出しと競合した場合に、読み込み直して処理し直す回数
+STATE_UPDATE_MAX_ATTEMPTS = int(os.environ.get("STATE_UPDATE_MAX_ATTEMPTS", "5"))
+
+
+class StateConflictError(Exception):
+    """Raised when another invocation saved the state after it was loaded."""
+
+
+class MemoryStateStore:
+    """Keep error states in the memory of a warm Lambda container."""
+
+    def __init__(self):
+        self._states = {}
+
+    def load(self, key: str) -> dict | None:
+        state = self._states.get(key)
+        if state is None:
+            return None
+        return dict(state)
+
+    def save(self, key: str, state: dict) -> dict:
+        # state["version"] は読み込んだ時の番号。保存されている番号と異なる場合は保存しない
+        current = self._states.get(key)
+        if (current or {}).get("version", 0) != (state.get("version") or 0):
+            raise StateConflictError(key)
+        # ErrorState は変更されないため、コピーせずにそのまま保持する
+        saved = {**state, "version": (state.get("version") or 0) + 1}
+        self._states[key] = saved
+        return dict(saved)
+
+
+class DynamoDBStateStore:
+    """Persist error states in DynamoDB so that they survive cold starts."""
+
+    def __init__(self, table_name: str):
+        self._table_name = table_name
+
+    def load(self, key: str) -> dict | None:
+        item = aws_clients.table(self._table_name).get_item(Key={"state_key": key}, ConsistentRead=True).get(
+            "Item"
+        )
+        if item is None:
+            return None
+        errors = item.get("errors", "0")
+        state = {
+            # エラーコードのリストで保存されている場合にも対応する
+            "errors": (
+                ErrorState.from_codes(errors)
+                if isinstance(errors, (list, set))
+                else ErrorState.from_hex(errors)
+            ),
+            "synced_at": float(item.get("synced_at", 0)),
+            # version を持たない項目は、この仕組みを導入する前に保存されたもの
+            "version": int(item.get("version", 0)),
+        }
+        if "timestamp" in item:
+            state["timestamp"] = item["timestamp"]
+        if "pending" in item:
+            state["pending"] = {
+                int(error_code): (float(since), int(count))
+                for error_code, (since, count) in item["pending"].items()
+            }
+        return state
+
+    def save(self, key: str, state: dict) -> dict:
+        # state["version"] は読み込んだ時の番号。保存されている番号と異なる場合は保存しない
+        from botocore.exceptions import ClientError
+
+        version = state.get("version") or 0
+        item = {
+            "state_key": key,
+            "errors": state["errors"].to_hex(),
+            "synced_at": Decimal(str(state.get("synced_at", 0))),
+            "updated_at": Decimal(str(time.time())),
+            "version": version + 1,
+        }
+        if state.get("timestamp"):
+            item["timestamp"] = state["timestamp"]
+        if "pending" in state:
+            item["pending"] = {
+                str(error_code): [Decimal(str(since)), count]
+                for error_code, (since, count) in state["pending"].items()
+            }
+        if version == 0:
+            # 項目がない場合と、version を持たない項目の場合
+            condition = {"ConditionExpression": "attribute_not_exists(#version)"}
+        else:
+            condition = {
+                "ConditionExpression": "#version = :version",
+                "ExpressionAttributeValues": {":version": version},
+            }
+        condition["ExpressionAttributeNames"] = {"#version": "version"}
+        try:
+            aws_clients.table(self._table_name).put_item(Item=item, **condition)
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise e
+            raise StateConflictError(key) from e
+        return {**state, "version": version + 1}
+
+
+def create_state_store(store_type: str | None = None):
+    # STATE_STORE 環境変数で利用するストアを切り替える
+    # memory   : Lambda コンテナのメモリ上に保持(デフォルト)
+    # dynamodb : ERROR_STATE_TABLE_NAME のテーブルに永続化
+    store_type = store_type or os.environ.get("STATE_STORE", "memory")
+    if store_type == "memory":
+        return MemoryStateStore()
+    if store_type == "dynamodb":
+        return DynamoDBStateStore(os.environ["ERROR_STATE_TABLE_NAME"])
+    raise ValueError("Unknown state store type: {}".format(store_type))
+
+
+def update_state(store, key: str, transition) -> tuple[dict | None, dict | None, object]:
+    # transition(state) は読み込んだ状態から、保存する状態と結果を返す。保存するものがない場合は状態を None とする。
+    # 保存が他の呼び出しと競合した場合は、読み込み直して transition を呼び出し直すため、
+    # transition では送信やアラートの登録などを行わず、保存に成功した後に結果に従って行うこと。
+    # (読み込んだ状態, 保存した状態, 結果) を返す。
+    for _ in range(STATE_UPDATE_MAX_ATTEMPTS):
+        state = store.load(key)
+        next_state, result = transition(state)
+        if next_state is None:
+            return state, None, result
+        try:
+            saved = store.save(
+                key, {**next_state, "version": (state or {}).get("version")}
+            )
+            return state, saved, result
+        except StateConflictError:
+            print("State conflict, reloading: {}".format(key))
+    raise StateConflictError(key)
+
+
+def restore_state(store, key: str, saved: dict, state: dict):
+    # saved を保存した後に、状態を state に戻す(送信やアラートの登録に失敗した場合など)。
+    # 既に別の呼び出しが saved より新しい状態を保存していた場合は、そちらを優先して上書きしない
+    try:
+        store.save(key, {**state, "version": saved["version"]})
+    except StateConflictError:
+        print("State was updated by another invocation, not restored: {}".format(key))
+
+
+def newer_samples(state: dict | None, samples: list) -> list:
+    # samples((ErrorState, 時刻) の時刻順のリスト)のうち、保存されている時刻より新しいものを返す
+    last = (state or {}).get("timestamp")
+    if last is None:
+        return samples
+    return [sample for sample in samples if sample[1] > last]
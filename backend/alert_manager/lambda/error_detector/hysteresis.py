@@ -0,0 +1,111 @@
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime
+
+from error_state import ErrorState
+
+# センサー値がしきい値付近で揺れると、PLC はサンプルごとにエラーコードの ON/OFF を繰り返す(チャタリング)。
+# 送信前にヒステリシスを適用し、エラーコードの ON/OFF が一定時間・一定回数続いた場合にだけ状態を切り替える。
+#   min_on_seconds  : 異常が継続してこの秒数以上続いた場合に異常とする
+#   on_count        : 異常が連続してこの回数以上続いた場合に異常とする
+#   min_off_seconds : 正常が継続してこの秒数以上続いた場合に正常とする
+#   off_count       : 正常が連続してこの回数以上続いた場合に正常とする
+# 時間と回数の両方を満たした場合に状態を切り替える。
+#
+# 設定は HYSTERESIS_CONFIG 環境変数に JSON で指定する。codes にはエラーコードごとの設定を指定する。
+# {
+#   "default": {"min_on_seconds": 0, "on_count": 1, "min_off_seconds": 30, "off_count": 5},
+#   "codes": {"12": {"min_on_seconds": 5, "on_count": 3}}
+# }
+#
+# 状態は {"errors": ErrorState, "pending": {エラーコード: (切り替わり始めた時刻, 連続回数)}} の形で扱う。
+#   errors  : ヒステリシス適用後の、異常となっているエラーコードの集合
+#   pending : 状態が切り替わりかけているエラーコード
+
+
+@dataclass(frozen=True)
+class HysteresisRule:
+    min_on_seconds: float = 0
+    on_count: int = 1
+    min_off_seconds: float = 0
+    off_count: int = 1
+
+    @property
+    def immediate(self) -> bool:
+        # 1 サンプルで状態を切り替える設定かどうか
+        return (
+            self.min_on_seconds <= 0
+            and self.on_count <= 1
+            and self.min_off_seconds <= 0
+            and self.off_count <= 1
+        )
+
+
+class Hysteresis:
+    def __init__(self, default_rule: HysteresisRule, rules: dict[int, HysteresisRule]):
+        self.default_rule = default_rule
+        self.rules = rules
+        # 即時に状態を切り替えるエラーコードはビット演算でまとめて処理する
+        self._delayed_codes = {
+            error_code for error_code, rule in rules.items() if not rule.immediate
+        }
+        self._immediate_overrides = ErrorState.from_codes(
+            error_code for error_code, rule in rules.items() if rule.immediate
+        )
+
+    @classmethod
+    def from_env(cls) -> "Hysteresis | None":
+        config = os.environ.get("HYSTERESIS_CONFIG")
+        if not config:
+            return None
+        return cls.from_config(json.loads(config))
+
+    @classmethod
+    def from_config(cls, config: dict) -> "Hysteresis":
+        default_rule = HysteresisRule(**config.get("default", {}))
+        rules = {
+            int(error_code): HysteresisRule(**{**config.get("default", {}), **rule})
+            for error_code, rule in config.get("codes", {}).items()
+        }
+        return cls(default_rule, rules)
+
+    def rule(self, error_code: int) -> HysteresisRule:
+        return self.rules.get(error_code, self.default_rule)
+
+    def _is_delayed(self, error_code: int) -> bool:
+        if error_code in self._delayed_codes:
+            return True
+        return not self.default_rule.immediate and error_code not in self._immediate_overrides
+
+    def apply(self, state: dict | None, errors: ErrorState, timestamp: str) -> dict:
+        # errors(今回のサンプルのエラーコード)にヒステリシスを適用し、適用後の状態を返す。
+        # 状態がない場合(コールドスタート直後など)は、今回のサンプルをそのまま適用後の状態とする。
+        if state is None:
+            return {"errors": errors, "pending": {}}
+
+        now = datetime.fromisoformat(timestamp).timestamp()
+        reported = state["errors"]
+        pending = {}
+        flips = []
+        # 適用後の状態と異なるエラーコードだけを調べる
+        for error_code in errors.diff(reported):
+            if not self._is_delayed(error_code):
+                flips.append(error_code)
+                continue
+            since, count = state["pending"].get(error_code, (now, 0))
+            count += 1
+            rule = self.rule(error_code)
+            if error_code in errors:
+                min_seconds, min_count = rule.min_on_seconds, rule.on_count
+            else:
+                min_seconds, min_count = rule.min_off_seconds, rule.off_count
+            if count >= min_count and now - since >= min_seconds:
+                flips.append(error_code)
+            else:
+                pending[error_code] = (since, count)
+
+        return {
+            "errors": reported ^ ErrorState.from_codes(flips),
+            "pending": pending,
+        }
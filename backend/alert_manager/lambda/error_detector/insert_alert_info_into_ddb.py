@@ -1,19 +1,59 @@
 import json
 import os
 import uuid
+from collections import OrderedDict
 
-import boto3
-from boto3.dynamodb.conditions import Key
+import aws_clients
+from alert_codec import encode
+from alert_version import bump_version
+from error_catalog import error_catalog
+from error_state import ErrorState
 
-dynamoDB = boto3.resource("dynamodb")
 ALERT_INFO_TABLE_NAME = os.environ["ALERT_INFO_TABLE_NAME"]
 ERROR_CODE_TABLE_NAME = os.environ["ERROR_CODE_TABLE_NAME"]
 
+# アラートの ID はゲートウェイ・エラーコード・発生時刻から決定的に作成する。
+# IoT Events の Lambda アクションが再試行されて同じ遷移で複数回呼び出されても、同じ ID となり
+# 重複したアラートは登録されない。
+ALERT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "knowledge-transfer-by-genai/alerts")
+# 最近登録したアラートの ID を覚えておく件数。覚えている ID のアラートは書き込み自体を行わない。
+RECENT_ALERT_IDS_MAX = int(os.environ.get("RECENT_ALERT_IDS_MAX", "1024"))
+
+# 複数のアラートを登録する場合に、並列に書き込むアラートの数
+INSERT_CONCURRENCY = int(os.environ.get("ALERT_INSERT_CONCURRENCY", "10"))
+
+_recent_alert_ids = OrderedDict()
+
 
 def handler(event, context):
     try:
         # JSTをUTCに変換
         timestamp = event.get("timestamp")
+        if "alerts" in event:
+            # 複数の遷移をまとめて受け取った場合は、まとめて登録する
+            # {"alerts": [{"timestamp": "...", "error": 1, "gateway_id": "..."}, ...]}
+            response = insert_alerts(
+                ALERT_INFO_TABLE_NAME, ERROR_CODE_TABLE_NAME, event["alerts"]
+            )
+            print_catalog_stats()
+            return {
+                "headers": {"Content-Type": "application/json"},
+                "body": json.dumps(response),
+            }
+        if "errors" in event:
+            # まとめて送信されたエラー状態の場合は、新たに異常となったエラーコードごとに登録する
+            response = insert_raised_alerts(
+                timestamp,
+                event.get("errors"),
+                event.get("previous"),
+                event.get("gateway_id"),
+            )
+            print_catalog_stats()
+            return {
+                "headers": {"Content-Type": "application/json"},
+                "body": json.dumps(response),
+            }
+
         error_code = str(event.get("error"))
 
         response = insert_alert_info(
@@ -21,7 +61,9 @@ def handler(event, context):
             ERROR_CODE_TABLE_NAME,
             timestamp,
             error_code,
+            event.get("gateway_id"),
         )
+        print_catalog_stats()
         return {
             "headers": {"Content-Type": "application/json"},
             "body": json.dumps(response),
@@ -33,20 +75,149 @@ def handler(event, context):
         raise e
 
 
+def print_catalog_stats():
+    stats = error_catalog(ERROR_CODE_TABLE_NAME).stats
+    print(f"error catalog stats: {json.dumps(stats)}")
+
+
+def insert_raised_alerts(
+    timestamp: str, errors: str, previous: str | None, gateway_id: str | None = None
+) -> dict:
+    # previous では正常で errors で異常となっているエラーコードが、
+    # 個別トピックの場合の Normal -> ErrorDetected の遷移に相当する
+    raised = ErrorState.from_hex(errors).raised(ErrorState.from_hex(previous))
+    return insert_alerts(
+        ALERT_INFO_TABLE_NAME,
+        ERROR_CODE_TABLE_NAME,
+        [
+            {"timestamp": timestamp, "error": error_code, "gateway_id": gateway_id}
+            for error_code in raised
+        ],
+    )
+
+
+def insert_alerts(
+    alert_info_table_name: str, error_code_table_name: str, alerts: list
+) -> dict:
+    # 複数のアラートをまとめて登録する。
+    # エラー情報はキャッシュにないものだけ BatchGetItem でまとめて取得する。
+    # アラートは insert_alert_info と同じく、既に同じ ID のアラートがない場合だけ書き込む条件付きの put_item で、
+    # 並列に書き込む(put_alerts)。条件を付けられない BatchWriteItem は使わず、
+    # 再試行された呼び出しが、先に登録されてクローズやコメントの追加をされたアラートを上書きしないようにする。
+    # エラーコードテーブルに存在しないエラーコードは登録せず、unknown として返す。
+    error_infos = error_catalog(error_code_table_name).get_many(
+        alert["error"] for alert in alerts
+    )
+    unknown = []
+    alert_infos = {}
+    for alert in alerts:
+        error_code = str(alert["error"])
+        error_info = error_infos.get(error_code)
+        if error_info is None:
+            unknown.append(error_code)
+            continue
+        alert_info = build_alert_info(
+            error_info, alert["timestamp"], alert.get("gateway_id")
+        )
+        # 最近登録したアラートと、同じイベント内で重複したアラートは書き込まない
+        if is_recent_alert(alert_info["id"]):
+            continue
+        alert_infos[alert_info["id"]] = alert_info
+
+    inserted = put_alerts(
+        aws_clients.table(alert_info_table_name), list(alert_infos.values())
+    )
+    for alert_id in alert_infos:
+        remember_alert_id(alert_id)
+
+    if unknown:
+        print("[ERROR] These error codes are not in Error DB: {}".format(unknown))
+    if inserted > 0:
+        # アラートの一覧のキャッシュを無効にする
+        bump_version()
+    return {
+        "inserted": inserted,
+        "duplicated": len(alerts) - len(unknown) - inserted,
+        "unknown": unknown,
+    }
+
+
+def put_alerts(alert_info_table, alert_infos: list) -> int:
+    # アラートを INSERT_CONCURRENCY 個ずつ並列に書き込み、書き込んだアラートの数を返す。
+    # テーブルのリソースはスレッド間で共有できないため、スレッドセーフなクライアント(table.meta.client)で書き込む
+    client = alert_info_table.meta.client
+    table_name = alert_info_table.name
+    if len(alert_infos) <= 1:
+        responses = [
+            put_alert(client, table_name, alert_info) for alert_info in alert_infos
+        ]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(
+            max_workers=min(INSERT_CONCURRENCY, len(alert_infos))
+        ) as executor:
+            responses = list(
+                executor.map(
+                    lambda alert_info: put_alert(client, table_name, alert_info),
+                    alert_infos,
+                )
+            )
+    return sum(response is not None for response in responses)
+
+
+def put_alert(client, table_name: str, alert_info: dict) -> dict | None:
+    # 既に同じ ID のアラートが登録されている場合は書き込まずに None を返す
+    from botocore.exceptions import ClientError
+
+    try:
+        return client.put_item(
+            TableName=table_name,
+            Item=encode(alert_info),
+            ConditionExpression="attribute_not_exists(id)",
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise e
+        print("Skip the duplicated alert: {}".format(alert_info["id"]))
+        return None
+
+
+def alert_id_of(gateway_id: str | None, error_code: str, opened_at: str) -> str:
+    return str(
+        uuid.uuid5(
+            ALERT_ID_NAMESPACE,
+            "{}|{}|{}".format(gateway_id or "", error_code, opened_at),
+        )
+    )
+
+
+def is_recent_alert(alert_id: str) -> bool:
+    if alert_id in _recent_alert_ids:
+        _recent_alert_ids.move_to_end(alert_id)
+        return True
+    return False
+
+
+def remember_alert_id(alert_id: str):
+    _recent_alert_ids[alert_id] = True
+    _recent_alert_ids.move_to_end(alert_id)
+    while len(_recent_alert_ids) > RECENT_ALERT_IDS_MAX:
+        _recent_alert_ids.popitem(last=False)
+
+
 def insert_alert_info(
     alert_info_table_name: str,
     error_code_table_name: str,
     timestamp: str,
     error_code: str,
+    gateway_id: str | None = None,
 ):
-    alert_info_table = dynamoDB.Table(alert_info_table_name)
-    error_code_table = dynamoDB.Table(error_code_table_name)
+    alert_info_table = aws_clients.table(alert_info_table_name)
 
-    # エラー情報を取得
+    # エラー情報をキャッシュから取得
     try:
-        error_info = error_code_table.query(
-            KeyConditionExpression=Key("error_code").eq(error_code)
-        )["Items"][0]
+        error_info = error_catalog(error_code_table_name).get(error_code)
     except IndexError as e:
         # IndexErrorのみを処理
         # その他、「dynamodbにアイテムをinsertする」処理で想定が難しいエラーは呼び出し元に処理を移譲する
@@ -54,8 +225,28 @@ def insert_alert_info(
         print(msg)
         raise e
 
-    # alert_id となる UUID を発行
-    alert_id = str(uuid.uuid4())
+    alert_info = build_alert_info(error_info, timestamp, gateway_id)
+    if is_recent_alert(alert_info["id"]):
+        print("Skip the duplicated alert: {}".format(alert_info["id"]))
+        return {"duplicated": True}
+
+    # 既に同じ ID のアラートが登録されている場合は書き込まない
+    response = put_alert(
+        alert_info_table.meta.client, alert_info_table.name, alert_info
+    )
+    if response is not None:
+        # アラートの一覧のキャッシュを無効にする
+        bump_version()
+    else:
+        response = {"duplicated": True}
+    remember_alert_id(alert_info["id"])
+
+    return response
+
+
+def build_alert_info(error_info: dict, timestamp: str, gateway_id: str | None) -> dict:
+    # alert_id となる UUID をゲートウェイ・エラーコード・発生時刻から作成
+    alert_id = alert_id_of(gateway_id, error_info["error_code"], timestamp)
     opened_at = timestamp
     closed_at = ""
     status = "OPEN"
@@ -84,8 +275,9 @@ def insert_alert_info(
         "conversation_id": conversation_id,
         "conversation": conversation,
         "meetingIds": [],
+        "error_code": str(error_info["error_code"]),
     }
-
-    response = alert_info_table.put_item(Item=alert_info)
-
-    return response
+    # どのゲートウェイ(生産ライン)で発生したアラートかを記録する
+    if gateway_id:
+        alert_info["gatewayId"] = gateway_id
+    return alert_info
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aws_clients
+
+# IoT Data の publish を並列実行するためのコンポーネント。
+# - 同時実行数は HTTP コネクションプールのサイズと一致させる
+# - ThrottlingException が発生した場合は同時実行数を半分に減らし(乗算減少)、
+#   成功するたびに少しずつ増やす(加算増加)AIMD で同時実行数を調整する
+# - 失敗した publish は Lambda の残り時間の範囲内でジッター付きバックオフでリトライする
+# - 呼び出しごとに publish / リトライ / スロットリング / 破棄の件数を集計する
+
+THROTTLING_ERROR_CODES = {"ThrottlingException", "TooManyRequestsException"}
+RETRYABLE_ERROR_CODES = THROTTLING_ERROR_CODES | {
+    "InternalFailureException",
+    "ServiceUnavailableException",
+    "RequestTimeoutException",
+}
+
+
+class IotPublisher:
+    def __init__(
+        self,
+        max_concurrency: int | None = None,
+        max_retries: int | None = None,
+        base_delay: float = 0.05,
+        max_delay: float = 2.0,
+        safety_margin_ms: int = 500,
+    ):
+        self.max_concurrency = max_concurrency or int(
+            os.environ.get("PUBLISH_MAX_CONCURRENCY", "10")
+        )
+        self.max_retries = (
+            max_retries
+            if max_retries is not None
+            else int(os.environ.get("PUBLISH_MAX_RETRIES", "5"))
+        )
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.safety_margin_ms = safety_margin_ms
+        # クライアントとスレッドプールは初回の publish 時に作成する
+        self._client = None
+        self._executor = None
+        # AIMD で調整する同時実行数。ウォームスタート時は前回の値を引き継ぐ。
+        self._limit = float(self.max_concurrency)
+        self.stats = self.empty_stats()
+
+    @property
+    def client(self):
+        if self._client is None:
+            from botocore.config import Config
+
+            # リトライは本コンポーネントで制御するため botocore のリトライは無効にする
+            self._client = aws_clients.client(
+                "iot-data",
+                config=Config(
+                    max_pool_connections=self.max_concurrency,
+                    retries={"max_attempts": 1, "mode": "standard"},
+                ),
+            )
+        return self._client
+
+    @staticmethod
+    def empty_stats() -> dict:
+        return {"published": 0, "retries": 0, "throttled": 0, "dropped": 0}
+
+    async def publish_many(
+        self, messages: list[tuple[str, str | bytes]], context=None
+    ) -> dict:
+        # messages は (topic, payload) のリスト
+        self.stats = self.empty_stats()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        self._in_flight = 0
+        self._condition = asyncio.Condition()
+        deadline = self._deadline(context)
+        # クライアントはスレッドプールに渡す前に、呼び出し元のスレッドで 1 回だけ作成する。
+        # 各スレッドで初めて参照すると、複数のスレッドが同時にクライアントを作成してしまう
+        client = self.client
+        await asyncio.gather(
+            *[
+                self._publish(client, topic, payload, deadline)
+                for topic, payload in messages
+            ]
+        )
+        return self.stats
+
+    def _deadline(self, context) -> float | None:
+        if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+            return None
+        remaining_ms = context.get_remaining_time_in_millis() - self.safety_margin_ms
+        return time.monotonic() + max(remaining_ms, 0) / 1000
+
+    async def _acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < int(self._limit))
+            self._in_flight += 1
+
+    async def _release(self):
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    async def _publish(
+        self, client, topic: str, payload: str, deadline: float | None
+    ):
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            await self._acquire()
+            try:
+                await loop.run_in_executor(
+                    self._executor,
+                    lambda: client.publish(topic=topic, qos=0, payload=payload),
+                )
+                error = None
+            except Exception as e:
+                error = e
+            finally:
+                await self._release()
+
+            if error is None:
+                self.stats["published"] += 1
+                self._increase_limit()
+                return
+
+            throttled = self._is_throttling(error)
+            if throttled:
+                self.stats["throttled"] += 1
+                self._decrease_limit()
+
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+            if (
+                not (throttled or self._is_retryable(error))
+                or attempt >= self.max_retries
+                or (deadline is not None and time.monotonic() + delay >= deadline)
+            ):
+                self.stats["dropped"] += 1
+                print(f"Error publishing to topic {topic}: {str(error)}")
+                return
+
+            self.stats["retries"] += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _increase_limit(self):
+        # 加算増加: 同時実行数分の publish が成功すると 1 増える
+        self._limit = min(self.max_concurrency, self._limit + 1 / self._limit)
+
+    def _decrease_limit(self):
+        # 乗算減少
+        self._limit = max(1.0, self._limit / 2)
+
+    @staticmethod
+    def _error_code(error: Exception) -> str | None:
+        from botocore.exceptions import ClientError
+
+        if not isinstance(error, ClientError):
+            return None
+        return error.response.get("Error", {}).get("Code")
+
+    @classmethod
+    def _is_throttling(cls, error: Exception) -> bool:
+        return cls._error_code(error) in THROTTLING_ERROR_CODES
+
+    @classmethod
+    def _is_retryable(cls, error: Exception) -> bool:
+        from botocore.exceptions import ConnectionError, HTTPClientError
+
+        if isinstance(error, (ConnectionError, HTTPClientError)):
+            return True
+        return cls._error_code(error) in RETRYABLE_ERROR_CODES
@@ -1,50 +1,144 @@
 import asyncio
+import base64
 import json
 import os
-from datetime import datetime
-from pprint import pprint
+import time
 
-import boto3
-from dateutil.tz import gettz
+from detector_engine import ErrorDetectorEngine
+from error_state import ErrorCodeRegistry, ErrorState
+from error_state_store import (
+    create_state_store,
+    newer_samples,
+    restore_state,
+    update_state,
+)
+from hysteresis import Hysteresis
+from iot_publisher import IotPublisher
+from plc_timestamp import convert_jst_to_utc
 
-iot = boto3.client("iot-data")
+publisher = IotPublisher()
 
-MAX_ERROR_ID = os.environ["MAX_ERROR_ID"]
+# 状態を送信するエラーコード。ERROR_CODES 環境変数、または 1 から MAX_ERROR_ID まで。
+ERROR_CODE_REGISTRY = ErrorCodeRegistry.from_env()
 ERROR_CODE_TOPIC_NAME = os.environ["ERROR_CODE_TOPIC_NAME"]
+# full  : 毎回すべてのエラーコードのトピックに状態を送信する(デフォルト)
+# delta : 前回から状態が変化したエラーコードのトピックにだけ送信する
+# aggregate : 異常となっている全エラーコードをまとめた 1 メッセージを ERROR_STATUS_TOPIC_NAME に送信する
+# inprocess : IoT Events を経由せず、この Lambda 関数の中で異常を検知してアラートを登録する
+PUBLISH_MODE = os.environ.get("PUBLISH_MODE", "full")
+# delta モードで全エラーコードを再送信(フル同期)する間隔(秒)。0 の場合は再送信しない。
+# メモリのストア(STATE_STORE=memory)では状態がコンテナごとに保持されるため、
+# 同じゲートウェイのデータを複数のコンテナが処理すると、各コンテナの状態が古くなって変化を送信し損ねる。
+# (例: コンテナ A がエラーコード 5 の異常を送信し、その後コンテナ B が正常を送信した場合、
+#  A が再び 5 の異常を受け取っても A の状態とは差がないため送信せず、検知器は Normal のままとなる)
+# DynamoDB のストアでも、同時に処理された呼び出しの送信が IoT Events に届く順序は保証されない。
+# (例: A が 5 の異常を、続けて B が正常を保存した後、B の送信が A の送信より先に届くと検知器は異常のままとなる)
+# 差分だけを送信していると、この後に 5 が変化するまで検知器はずれたままとなるため、
+# デフォルトでストアにかかわらず 60 秒ごとにフル同期し、状態がずれる時間を抑える。
+# ゲートウェイごとに順序どおり 1 つずつ処理する構成(Kinesis Data Streams)では 0 としてよい。
+RESYNC_INTERVAL_SECONDS = float(os.environ.get("RESYNC_INTERVAL_SECONDS", "60"))
+# ゲートウェイ(PLC データを送信した IoT クライアント)が分からないメッセージのゲートウェイ ID。
+# 状態やトピック、IoT Events の検知器はゲートウェイごとに分ける。
+DEFAULT_GATEWAY_ID = "default"
+ERROR_STATUS_TOPIC_NAME = os.environ.get("ERROR_STATUS_TOPIC_NAME", "plc/error_status")
 
+# エラーコードのチャタリングを抑制するヒステリシスの設定。HYSTERESIS_CONFIG 環境変数がない場合は適用しない。
+hysteresis = Hysteresis.from_env()
 
-async def publish_to_topic(error_code, timestamp, is_normal):
-    error = {
-        "timestamp": str(timestamp),
-        "isNormal": str(is_normal),  # 異常かどうか
-        # "isConnected": str(True),
-        "error": str(error_code),  # IoT Events が判断するためのエラーコード
-    }
-    try:
-        await asyncio.to_thread(
-            iot.publish,
-            topic=ERROR_CODE_TOPIC_NAME + str(error_code),
-            qos=0,
-            payload=json.dumps(error),
+state_store = (
+    create_state_store()
+    if PUBLISH_MODE in ("delta", "inprocess") or hysteresis is not None
+    else None
+)
+# batch_handler が利用するストア。handler だけを利用する構成では不要なため、初回の呼び出し時に作成する
+_batch_state_store = None
+
+
+def batch_state_store():
+    # batch_handler は送信モードにかかわらず、バッチをまたいだ状態の比較にストアを利用する。
+    # 同じゲートウェイのバッチが別のコンテナで処理されることがあるため、
+    # キューやストリームから受け取る構成では STATE_STORE=dynamodb とすること
+    global _batch_state_store
+    if _batch_state_store is None:
+        _batch_state_store = state_store or create_state_store()
+    return _batch_state_store
+
+
+def build_error_message_templates(error_codes, gateway_id: str = DEFAULT_GATEWAY_ID) -> dict:
+    # 各エラーコードのトピック名と、正常/異常それぞれの送信データのテンプレートを作成しておく。
+    # 送信データは以下の JSON で、送信時には timestamp の値だけを埋め込む。
+    # {"timestamp": "...", "isNormal": "True" or "False", "error": "<エラーコード>",
+    #  "gateway_id": "<ゲートウェイ ID>", "detector_key": "<ゲートウェイ ID>#<エラーコード>"}
+    #   isNormal     : 異常かどうか
+    #   error        : IoT Events が判断するためのエラーコード
+    #   detector_key : IoT Events の検知器のキー。ゲートウェイとエラーコードの組ごとに検知器を分ける
+    # トピック名はゲートウェイごとに plc/error/<ゲートウェイ ID>/<エラーコード> とする。
+    # ゲートウェイが分からない場合は従来どおり plc/error/<エラーコード> とする。
+    topic_prefix = ERROR_CODE_TOPIC_NAME
+    if gateway_id != DEFAULT_GATEWAY_ID:
+        topic_prefix += gateway_id + "/"
+    templates = {}
+    for error_code in error_codes:
+        payload_suffixes = {}
+        for is_normal in (True, False):
+            rest = json.dumps(
+                {
+                    "isNormal": str(is_normal),
+                    "error": str(error_code),
+                    "gateway_id": gateway_id,
+                    "detector_key": "{}#{}".format(gateway_id, error_code),
+                }
+            )
+            payload_suffixes[is_normal] = (", " + rest[1:]).encode()
+        templates[error_code] = (
+            topic_prefix + str(error_code),
+            payload_suffixes,
         )
-    except Exception as e:
-        print(f"Error publishing to topic {error_code}: {str(e)}")
+    return templates
 
 
-async def send_error_data_to_errortopic(error_list: list[int], timestamp: str):
+# ゲートウェイごとのテンプレート。ゲートウェイが分からない場合のテンプレートはコールドスタート時に作成しておく。
+ERROR_MESSAGE_TEMPLATES = {
+    DEFAULT_GATEWAY_ID: build_error_message_templates(ERROR_CODE_REGISTRY),
+}
+PAYLOAD_PREFIX = b'{"timestamp": '
+
+
+def error_message_templates(gateway_id: str) -> dict:
+    # 初めてデータを受け取ったゲートウェイのテンプレートは、その時に作成して使い回す
+    templates = ERROR_MESSAGE_TEMPLATES.get(gateway_id)
+    if templates is None:
+        templates = build_error_message_templates(ERROR_CODE_REGISTRY, gateway_id)
+        ERROR_MESSAGE_TEMPLATES[gateway_id] = templates
+    return templates
+
+
+async def send_error_data_to_errortopic(
+    errors: ErrorState,
+    timestamp: str,
+    error_codes=None,
+    context=None,
+    gateway_id: str = DEFAULT_GATEWAY_ID,
+) -> dict:
     # 各エラーコードトピックにエラーが発生しているかどうかの状態を送信する。
     # 各エラーコードのトピックはエラーコードの数だけ存在する。
     # IoT Events は各トピックのデータを参照して、各エラーコードの異常が発生しているかの状態を判断している。
-    # error_list に含まれる数値は異常となっているエラーコードであり、
-    # error_list に含まれる数値のエラーコードのトピックには異常であることを示すデータを送信、
+    # errors に含まれる数値は異常となっているエラーコードであり、
+    # errors に含まれる数値のエラーコードのトピックには異常であることを示すデータを送信、
     # 含まれないものは正常であることを示すデータを送信する。
-    tasks = []
-    for error_code in range(1, int(MAX_ERROR_ID) + 1):
-        is_normal = error_code not in error_list
-        task = asyncio.create_task(publish_to_topic(error_code, timestamp, is_normal))
-        tasks.append(task)
+    # error_codes を指定した場合は、そのエラーコードのトピックにだけ送信する。
+    if error_codes is None:
+        error_codes = ERROR_CODE_REGISTRY
+    templates = error_message_templates(gateway_id)
+    # timestamp は全エラーコードで共通なので、JSON への変換は 1 回だけ行う
+    payload_timestamp = PAYLOAD_PREFIX + json.dumps(str(timestamp)).encode()
+    messages = []
+    for error_code in error_codes:
+        topic, payload_suffixes = templates[error_code]
+        is_normal = error_code not in errors
+        messages.append((topic, payload_timestamp + payload_suffixes[is_normal]))
 
-    await asyncio.gather(*tasks, return_exceptions=True)
+    return await publisher.publish_many(messages, context)
 
 
 def handler(event, context):
@@ -62,16 +156,276 @@ def handler(event, context):
     if len(error_list) == 0:
         return
 
+    errors = ERROR_CODE_REGISTRY.state(error_list)
     timestamp = convert_jst_to_utc(event.get("timestamp"))
-    asyncio.run(send_error_data_to_errortopic(error_list, timestamp))
+    # IoT ルールで clientId() を gateway_id として付与している
+    gateway_id = event.get("gateway_id") or DEFAULT_GATEWAY_ID
+    if PUBLISH_MODE in ("delta", "inprocess"):
+        stats = process_samples(state_store, gateway_id, [(errors, timestamp)], context)
+    else:
+        if hysteresis is not None:
+            samples = apply_hysteresis(state_store, gateway_id, [(errors, timestamp)])
+            if not samples:
+                print("Skip the stale message: {} {}".format(gateway_id, timestamp))
+                return IotPublisher.empty_stats()
+            errors = samples[0][0]
+        if PUBLISH_MODE == "aggregate":
+            stats = send_error_status(errors, timestamp, context, gateway_id)
+        else:
+            stats = asyncio.run(
+                send_error_data_to_errortopic(
+                    errors, timestamp, context=context, gateway_id=gateway_id
+                )
+            )
+    print(f"publish stats: {json.dumps(stats)}")
+    return stats
+
+
+def apply_hysteresis(store, key: str, samples: list) -> list:
+    # samples((ErrorState, 時刻) の時刻順のリスト)にヒステリシスを適用し、適用後のリストを返す。
+    # 反映済みの時刻以前のサンプルは除く。
+    # ヒステリシスの状態は、送信した状態とは別のキーで保存する
+    def transition(state):
+        applied = []
+        for errors, timestamp in newer_samples(state, samples):
+            state = hysteresis.apply(state, errors, timestamp)
+            applied.append((state["errors"], timestamp))
+        if not applied:
+            return None, applied
+        return {**state, "timestamp": applied[-1][1]}, applied
+
+    return update_state(store, key + "#hysteresis", transition)[2]
+
+
+def process_samples(
+    store, gateway_id: str, samples: list, context=None
+) -> dict:
+    # ゲートウェイの samples((ErrorState, 時刻) の時刻順のリスト)を前回送信した状態と比較して、
+    # 変化分を送信する(inprocess モードではアラートを登録する)。
+    # 同じゲートウェイの別の呼び出しと同時に処理されても同じ変化を重複して送信・登録しないよう、
+    # 状態を条件付きで保存できた場合にだけ送信する。反映済みの時刻以前のサンプルは読み飛ばす。
+    if hysteresis is not None:
+        samples = apply_hysteresis(store, gateway_id, samples)
+
+    def transition(state):
+        now = time.time()
+        steps = []
+        newer = newer_samples(state, samples)
+        for errors, timestamp in newer:
+            state, step = plan_transition(state, errors, timestamp, now)
+            if step is not None:
+                steps.append(step)
+        return (state if newer else None), steps
+
+    previous, saved, steps = update_state(store, gateway_id, transition)
+    if saved is None:
+        print("Skip the stale messages: {} {}".format(gateway_id, len(samples)))
+        return IotPublisher.empty_stats()
+    return run_steps(store, gateway_id, previous, saved, steps, context)
+
+
+def insert_alerts(gateway_id: str, raised: ErrorState, timestamp: str):
+    # inprocess モードで Normal -> ErrorDetected に遷移したエラーコードのアラートを登録する。
+    # アラート登録用のモジュールは inprocess モードでだけ必要なので、利用時に import する。
+    from insert_alert_info_into_ddb import (
+        ALERT_INFO_TABLE_NAME,
+        ERROR_CODE_TABLE_NAME,
+        insert_alerts as insert_alert_batch,
+    )
+
+    insert_alert_batch(
+        ALERT_INFO_TABLE_NAME,
+        ERROR_CODE_TABLE_NAME,
+        [
+            {"timestamp": timestamp, "error": error_code, "gateway_id": gateway_id}
+            for error_code in raised
+        ],
+    )
+
+
+detector_engine = ErrorDetectorEngine(insert_alerts)
 
 
-def convert_jst_to_utc(timestamp: str) -> str:
-    # PLCから送られてくる時刻はJST
-    timestamp_jst = datetime.strptime(timestamp + "+0900", "%Y%m%d %H:%M:%S.%f%z")
-    # UTC に変換
-    timestamp_utc = timestamp_jst.astimezone(gettz("UTC")).strftime(
-        "%Y-%m-%d %H:%M:%S.%f"
+def plan_transition(
+    state: dict | None, errors: ErrorState, timestamp: str, now: float
+) -> tuple[dict, tuple | None]:
+    # state(前回送信した状態)から errors への遷移後の状態と、送信する内容
+    # (errors, timestamp, 送信するエラーコード)を返す。送信するものがない場合は None を返す。
+    # 送信やアラートの登録は、状態を保存できた後に run_steps で行う。
+    # inprocess モードでは、送信するエラーコードの代わりに Normal -> ErrorDetected に遷移したエラーコードを返す。
+    if PUBLISH_MODE == "inprocess":
+        state, raised = detector_engine.next_state(state, errors)
+        state["timestamp"] = timestamp
+        return state, ((errors, timestamp, raised) if raised else None)
+
+    # 状態が保存されていない場合(コールドスタート直後など)や、
+    # 前回のフル同期から RESYNC_INTERVAL_SECONDS 以上経過した場合は全エラーコードを送信する。
+    # 送信できなかったエラーコードがあった場合は synced_at を 0 として保存し、次回フル同期する。
+    if state is None or state["synced_at"] == 0 or (
+        RESYNC_INTERVAL_SECONDS > 0
+        and now - state["synced_at"] >= RESYNC_INTERVAL_SECONDS
+    ):
+        error_codes = None
+        synced_at = now
+    else:
+        # 変化したエラーコードだけをビット演算で求める
+        error_codes = list(errors.diff(state["errors"]))
+        synced_at = state["synced_at"]
+
+    state = {"errors": errors, "synced_at": synced_at, "timestamp": timestamp}
+    if error_codes is not None and len(error_codes) == 0:
+        return state, None
+    return state, (errors, timestamp, error_codes)
+
+
+def run_steps(
+    store, gateway_id: str, previous: dict | None, saved: dict, steps: list, context=None
+) -> dict:
+    # 保存した状態への変化分(plan_transition が返した内容)を順に送信する
+    stats = IotPublisher.empty_stats()
+    if PUBLISH_MODE == "inprocess":
+        try:
+            for _, timestamp, raised in steps:
+                detector_engine.on_error_detected(gateway_id, raised, timestamp)
+        except Exception as e:
+            # 再試行で同じ遷移を検知し直せるよう、状態を元に戻してから呼び出し元に送出する。
+            # 登録済みのアラートは ID が同じになるため、再試行で重複して登録されない
+            restore_state(
+                store,
+                gateway_id,
+                saved,
+                previous or {"errors": ErrorState(), "synced_at": 0},
+            )
+            raise e
+        stats["alerts"] = sum(len(raised) for _, _, raised in steps)
+        return stats
+
+    for errors, timestamp, error_codes in steps:
+        if PUBLISH_MODE == "aggregate":
+            step_stats = send_error_status(errors, timestamp, context, gateway_id)
+        else:
+            step_stats = asyncio.run(
+                send_error_data_to_errortopic(
+                    errors, timestamp, error_codes, context, gateway_id
+                )
+            )
+        for key, value in step_stats.items():
+            stats[key] = stats.get(key, 0) + value
+    if stats["dropped"] > 0:
+        restore_state(store, gateway_id, saved, {**saved, "synced_at": 0})
+    return stats
+
+
+def batch_handler(event, context):
+    # キューやストリームから複数の PLC メッセージをまとめて受け取り、
+    # ゲートウェイごとに時刻順に並べて、エラーコードの集合が変化したメッセージの分だけ送信する。
+    # 連続して同じエラーコードの集合が続くメッセージは 1 つにまとめられる。
+    # 標準キューは順序を保証せず、同じゲートウェイのバッチが並行して処理されることもあるため、
+    # 反映済みのメッセージより古いメッセージは process_samples で読み飛ばす。
+    # 処理できなかったレコードだけを batchItemFailures で返し、バッチ全体を再試行させない
+    # (イベントソースで ReportBatchItemFailures を有効にしておくこと)。
+    store = batch_state_store()
+
+    failures = []
+    records = batch_records(event)
+    samples_by_gateway = {}
+    for item_identifier, message in records:
+        try:
+            sample = parse_message(message)
+        except Exception as e:
+            # 不正なメッセージは、このレコードだけを失敗として返す
+            print("Failed to parse the record {}: {}".format(item_identifier, e))
+            failures.append(item_identifier)
+            continue
+        if sample is None:
+            continue
+        gateway_id, errors, timestamp = sample
+        samples_by_gateway.setdefault(gateway_id, []).append(
+            (errors, timestamp, item_identifier)
+        )
+
+    total_stats = IotPublisher.empty_stats()
+    for gateway_id, entries in samples_by_gateway.items():
+        entries.sort(key=lambda entry: entry[1])
+        try:
+            stats = process_samples(
+                store,
+                gateway_id,
+                [(errors, timestamp) for errors, timestamp, _ in entries],
+                context,
+            )
+        except Exception as e:
+            # 失敗したゲートウェイのレコードだけを再試行させる。
+            # 他のゲートウェイや、再試行で届く反映済みのメッセージは読み飛ばされる
+            print("Failed to process the gateway {}: {}".format(gateway_id, e))
+            failures.extend(item_identifier for _, _, item_identifier in entries)
+            continue
+        for key, value in stats.items():
+            total_stats[key] = total_stats.get(key, 0) + value
+
+    print(
+        f"batch size: {len(records)}, gateways: {len(samples_by_gateway)}, "
+        f"failures: {len(failures)}, publish stats: {json.dumps(total_stats)}"
+    )
+    if None in failures:
+        # レコードを識別できないイベント(PLC メッセージのリスト)では、呼び出し全体を失敗とする
+        raise RuntimeError("Failed to process {} messages".format(len(failures)))
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": item_identifier} for item_identifier in failures
+        ]
+    }
+
+
+def batch_records(event) -> list[tuple[str | None, object]]:
+    # (レコードの識別子, PLC メッセージ) のリストを返す。以下の形式のイベントに対応する
+    # - PLC メッセージのリスト(識別子は None)
+    # - SQS のイベント(各レコードの body が PLC メッセージの JSON。識別子は messageId)
+    # - Kinesis Data Streams のイベント(各レコードの data が PLC メッセージの JSON を base64 エンコードしたもの。
+    #   識別子は sequenceNumber)
+    if isinstance(event, list):
+        return [(None, message) for message in event]
+    records = []
+    for record in event.get("Records", []):
+        if "body" in record:
+            records.append((record["messageId"], record["body"]))
+        elif "kinesis" in record:
+            records.append(
+                (
+                    record["kinesis"]["sequenceNumber"],
+                    base64.b64decode(record["kinesis"]["data"]),
+                )
+            )
+    return records
+
+
+def parse_message(message) -> tuple[str, ErrorState, str] | None:
+    # PLC メッセージ(JSON の場合は変換する)から (ゲートウェイ ID, エラーコード, UTC の時刻) を返す。
+    # エラーコードがないメッセージは handler と同様に読み飛ばすため None を返す
+    if isinstance(message, (str, bytes)):
+        message = json.loads(message)
+    error_list = message.get("error") or []
+    if len(error_list) == 0:
+        return None
+    return (
+        message.get("gateway_id") or DEFAULT_GATEWAY_ID,
+        ERROR_CODE_REGISTRY.state(error_list),
+        convert_jst_to_utc(message.get("timestamp")),
+    )
+
+
+def send_error_status(
+    errors: ErrorState, timestamp: str, context=None, gateway_id: str = DEFAULT_GATEWAY_ID
+) -> dict:
+    # 異常となっているエラーコードをビットマップにまとめて 1 メッセージだけ送信する。
+    # IoT Events 側はゲートウェイごとに前回のビットマップと比較して、新たに異常となったエラーコードのアラートを登録する。
+    error_status = {
+        "timestamp": str(timestamp),
+        "errors": errors.to_hex(),
+        "gateway_id": gateway_id,
+    }
+    return asyncio.run(
+        publisher.publish_many(
+            [(ERROR_STATUS_TOPIC_NAME, json.dumps(error_status))], context
+        )
     )
-    timestamp_utc = timestamp_utc.replace(" ", "T") + "Z"
-    return timestamp_utc
@@ -2,11 +2,11 @@ import json
 import os
 from http import HTTPMethod, HTTPStatus
 import urllib.parse
-from datetime import datetime
 
-import boto3
+import aws_clients
+from http_response import is_not_modified, make_etag, not_modified, response
+from plc_timestamp import timestream_to_iso_batch
 
-timestream_client = boto3.client("timestream-query")
 DATABASE_NAME = os.environ["DATABASE_NAME"]
 TABLE_NAME = os.environ["TABLE_NAME"]
 
@@ -18,10 +18,7 @@ def handler(event, context):
         # HTTP Method のチェック
         if event["httpMethod"] != HTTPMethod.GET:
             status_code = HTTPStatus.METHOD_NOT_ALLOWED
-            return {
-                "statusCode": status_code,
-                "headers": {"Content-Type": "text/plain"},
-            }
+            return response(status_code, event=event, content_type="text/plain")
 
         # Query Parameter のチェック
         loop_name = event.get("pathParameters").get("loop_name")
@@ -34,27 +31,28 @@ def handler(event, context):
             print("[DEBUG] loop_name is {}".format(loop_name))
             print("[DEBUG] start is {}".format(start))
             print("[DEBUG] end is {}".format(end))
-            response = {}
+            query_response = {}
         else:
-            response = query_db(DATABASE_NAME, TABLE_NAME, loop_name, start, end)
+            query_response = query_db(DATABASE_NAME, TABLE_NAME, loop_name, start, end)
             # Timestreamに存在していないloop_nameだった場合、もしくは
             # データが存在していない時刻を指定していた場合は422を返す
-            if len(response) == 0:
+            if len(query_response) == 0:
                 status_code = HTTPStatus.NOT_FOUND
                 print(
                     "[ERROR] Loop_name is not in Timestream or no data at the specified time in Timestream."
                 )
 
-        shaped_response = shape_response(response)
+        # 行数と最後の行から弱い ETag を作成する。
+        # Timestream のデータは時刻の順に追加されるため、範囲内の行数と最後の行が同じであれば同じ内容とみなす。
+        # クライアントが持っている内容と同じ場合は、レスポンスの整形や JSON への変換をせずに 304 を返す
+        headers = {"Access-Control-Expose-Headers": "ETag"}
+        etag = plc_data_etag(status_code, loop_name, start, end, query_response)
+        if is_not_modified(event, etag):
+            return not_modified(etag, headers)
 
-        return {
-            "statusCode": status_code,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-            },
-            "body": json.dumps(shaped_response),
-        }
+        shaped_response = shape_response(query_response)
+
+        return response(status_code, shaped_response, event, headers, etag=etag)
     except Exception as e:
         print("[ERROR] {}".format(e))
         raise e
@@ -75,7 +73,7 @@ def query_db(
          "time" BETWEEN '{start}' AND '{end}' 
         ORDER BY time"""
 
-        response = timestream_client.query(QueryString=query)
+        response = aws_clients.client("timestream-query").query(QueryString=query)
         return response
     except Exception as e:
         print("[ERROR] Failed to execute query: {}".format(query))
@@ -83,6 +81,16 @@ def query_db(
         raise e
 
 
+def plc_data_etag(
+    status_code: int, loop_name: str, start: str, end: str, query_response: dict
+) -> str:
+    rows = query_response.get("Rows") or []
+    last_row = rows[-1]["Data"] if rows else None
+    return make_etag(
+        int(status_code), loop_name, start, end, len(rows), last_row, weak=True
+    )
+
+
 def set_query_parameters(query_string_parameters: dict) -> tuple:
     try:
         start = None
@@ -140,16 +148,13 @@ def shape_response(response: dict) -> list:
         # {timestamp, tag_name, measure_value} の辞書のリストを
         # バリューにした辞書である data_dict を作成する。
         data_dict = {}
-        for data in response["Rows"]:
-            # SELECT time, measure_name(loop_name), measure_value::varchar とクエリを投げたので
-            # 1つめには時刻が格納されている
-            timestamp = data["Data"][0]["ScalarValue"]
-            ## ISO 形式に変換
-            # datetime.strptime を利用するにはマイクロ秒の桁数は6桁に丸める
-            timestamp = timestamp.rstrip("000")
-            timestamp_obj = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S.%f")
-            timestamp = timestamp_obj.isoformat() + "Z"
-
+        # SELECT time, measure_name(loop_name), measure_value::varchar とクエリを投げたので
+        # 1つめには時刻が格納されている
+        # 全行の時刻をまとめて ISO 形式に変換する
+        timestamps = timestream_to_iso_batch(
+            [data["Data"][0]["ScalarValue"] for data in response["Rows"]]
+        )
+        for data, timestamp in zip(response["Rows"], timestamps):
             # 2つめにはloop_nameが格納されている
             loop_name = data["Data"][1]["ScalarValue"]
 
@@ -0,0 +1,89 @@
+"""Check the import time of each alert manager Lambda handler against a budget.
+
+Usage:
+    python backend/alert_manager/scripts/check_import_time.py [--update]
+
+Each handler module is imported in a fresh interpreter with ``-X importtime``
+and the cumulative import time of the module is compared with the budget in
+``import_time_budgets.json``. The best of several runs is used to reduce noise.
+The script exits with status 1 when any handler exceeds its budget.
+``--update`` rewrites the budget file from the current measurements.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(SCRIPT_DIR, "..", "lambda")
+COMMON_DIR = os.path.join(LAMBDA_DIR, "common", "python")
+BUDGET_FILE = os.path.join(SCRIPT_DIR, "import_time_budgets.json")
+RUNS = 5
+# --update で予算を作成する際の、計測値に対する余裕
+HEADROOM = 2.0
+
+# import 時に参照される環境変数のダミー値
+DUMMY_ENVIRONMENT = {
+    "AWS_DEFAULT_REGION": "ap-northeast-1",
+    "TABLE_NAME": "dummy",
+    "DATABASE_NAME": "dummy",
+    "ALERT_INFO_TABLE_NAME": "dummy",
+    "ERROR_CODE_TABLE_NAME": "dummy",
+    "MAX_ERROR_ID": "90",
+    "ERROR_CODE_TOPIC_NAME": "plc/error/",
+}
+
+
+def measure(handler: str) -> int:
+    # handler は "<ディレクトリ>/<モジュール名>" の形式
+    directory, module = handler.split("/")
+    env = dict(os.environ, **DUMMY_ENVIRONMENT)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.join(LAMBDA_DIR, directory), COMMON_DIR]
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # "import time:       self [us] |  cumulative | imported package"
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if fields[2].strip() == module:
+            return int(fields[1])
+    raise RuntimeError(f"import time of {module} was not reported")
+
+
+def main():
+    update = "--update" in sys.argv[1:]
+    with open(BUDGET_FILE) as f:
+        budgets = json.load(f)
+
+    failed = []
+    for handler, budget in budgets.items():
+        cumulative = min(measure(handler) for _ in range(RUNS))
+        status = "OK" if cumulative <= budget else "OVER BUDGET"
+        print(f"{handler:50s} {cumulative:8d} us / {budget:8d} us  {status}")
+        if cumulative > budget:
+            failed.append(handler)
+        if update:
+            budgets[handler] = -(-int(cumulative * HEADROOM) // 1000) * 1000
+
+    if update:
+        with open(BUDGET_FILE, "w") as f:
+            json.dump(budgets, f, indent=2)
+            f.write("\n")
+        return
+
+    if failed:
+        print(f"[ERROR] import time budget exceeded: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import os
+import sys
+
+# Lambda 関数と共通レイヤーのモジュールを、デプロイ時と同じくトップレベルで import できるようにする
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(TESTS_DIR, "..", "lambda")
+for path in (
+    os.path.join(LAMBDA_DIR, "common", "python"),
+    os.path.join(LAMBDA_DIR, "error_detector"),
+    os.path.join(LAMBDA_DIR, "alerts_api"),
+):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
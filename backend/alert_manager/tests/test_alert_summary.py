@@ -0,0 +1,120 @@
+import pytest
+
+import aws_clients
+from alert_summary import UPDATE_MAX_COUNTERS, apply_deltas, to_summary
+from update_alert_summary import handler
+
+TABLE_NAME = "alert_summary_table"
+
+
+class StubClient:
+    """Applies TransactWriteItems updates once per ClientRequestToken."""
+
+    def __init__(self, table):
+        self.table = table
+        self.tokens = set()
+        self.calls = 0
+
+    def transact_write_items(self, TransactItems, ClientRequestToken):
+        self.calls += 1
+        if ClientRequestToken in self.tokens:
+            return {}
+        self.tokens.add(ClientRequestToken)
+        for transact_item in TransactItems:
+            update = transact_item["Update"]
+            names = update["ExpressionAttributeNames"]
+            values = update["ExpressionAttributeValues"]
+            item = self.table.items.setdefault(update["Key"]["id"], {"id": update["Key"]["id"]})
+            item["updatedAt"] = values[":updatedAt"]
+            for key, name in names.items():
+                if key != "#updatedAt":
+                    item[name] = item.get(name, 0) + values[":" + key[1:]]
+        return {}
+
+
+class StubMeta:
+    def __init__(self, client):
+        self.client = client
+
+
+class StubTable:
+    """In-memory stand-in for the boto3 Table resource."""
+
+    def __init__(self):
+        self.name = TABLE_NAME
+        self.items = {}
+        self.meta = StubMeta(StubClient(self))
+
+    def update_item(self, **kwargs):
+        # bump_version
+        pass
+
+
+@pytest.fixture
+def table(monkeypatch):
+    monkeypatch.setenv("SUMMARY_TABLE_NAME", TABLE_NAME)
+    table = StubTable()
+    aws_clients._tables[TABLE_NAME] = table
+    yield table
+    del aws_clients._tables[TABLE_NAME]
+
+
+def image(status, severity="HIGH", category="PLC"):
+    return {
+        "status": {"S": status},
+        "severity": {"S": severity},
+        "category": {"S": category},
+    }
+
+
+def record(event_id, old=None, new=None, created=1712816401):
+    images = {"ApproximateCreationDateTime": created}
+    if old is not None:
+        images["OldImage"] = old
+    if new is not None:
+        images["NewImage"] = new
+    return {"eventID": event_id, "dynamodb": images}
+
+
+def test_handler_counts_stream_records(table):
+    handler(
+        {
+            "Records": [
+                record("1", new=image("OPEN")),
+                record("2", new=image("OPEN", severity="LOW")),
+                record("3", old=image("OPEN"), new=image("CLOSED")),
+            ]
+        },
+        None,
+    )
+
+    summary = to_summary(table.items["alerts"])
+    assert summary["statuses"]["OPEN"]["total"] == 1
+    assert summary["statuses"]["OPEN"]["severity"] == {"LOW": 1}
+    assert summary["statuses"]["CLOSED"]["total"] == 1
+    assert summary["updatedAt"] == "2024-04-11T06:20:01.000000Z"
+
+
+def test_retried_batch_is_not_counted_twice(table):
+    # 121 件のアラートは複数回の書き込みに分かれる
+    event = {"Records": [record(str(i), new=image("OPEN")) for i in range(121)]}
+
+    handler(event, None)
+    calls = table.meta.client.calls
+    handler(event, None)
+
+    assert calls > 1
+    assert table.meta.client.calls == 2 * calls
+    assert table.items["alerts"]["OPEN#total"] == 121
+
+
+def test_apply_deltas_skips_unchanged_counters(table):
+    assert apply_deltas(table, {"OPEN#total": 0}, "token", "t1") == 0
+    assert table.meta.client.calls == 0
+
+
+def test_apply_deltas_rejects_too_many_counters(table):
+    deltas = {f"OPEN#category#{i}": 1 for i in range(UPDATE_MAX_COUNTERS + 1)}
+
+    with pytest.raises(ValueError):
+        apply_deltas(table, deltas, "token", "t1")
@@ -0,0 +1,87 @@
+import pytest
+
+from detector_engine import ErrorDetectorEngine
+from error_state import ErrorState
+
+
+class RecordingCallback:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, key, raised, timestamp):
+        self.calls.append((key, raised, timestamp))
+
+
+def test_none_state_treats_every_active_code_as_raised():
+    callback = RecordingCallback()
+    engine = ErrorDetectorEngine(callback)
+
+    state, raised = engine.transition(None, ErrorState.from_codes([3, 5]), "t1", "gw")
+
+    assert raised == ErrorState.from_codes([3, 5])
+    assert state == {"errors": ErrorState.from_codes([3, 5])}
+    assert callback.calls == [("gw", ErrorState.from_codes([3, 5]), "t1")]
+
+
+def test_none_state_without_errors_raises_nothing():
+    callback = RecordingCallback()
+    engine = ErrorDetectorEngine(callback)
+
+    state, raised = engine.transition(None, ErrorState(), "t1", "gw")
+
+    assert not raised
+    assert state == {"errors": ErrorState()}
+    assert callback.calls == []
+
+
+def test_normal_to_error_detected_to_normal():
+    callback = RecordingCallback()
+    engine = ErrorDetectorEngine(callback)
+
+    # Normal -> ErrorDetected: アラートを登録する
+    state, raised = engine.transition(
+        {"errors": ErrorState()}, ErrorState.from_codes([5]), "t1", "gw"
+    )
+    assert raised == ErrorState.from_codes([5])
+    assert callback.calls == [("gw", ErrorState.from_codes([5]), "t1")]
+
+    # ErrorDetected のまま: 再び登録しない
+    state, raised = engine.transition(state, ErrorState.from_codes([5]), "t2", "gw")
+    assert not raised
+    assert len(callback.calls) == 1
+
+    # ErrorDetected -> Normal: 登録しない
+    state, raised = engine.transition(state, ErrorState(), "t3", "gw")
+    assert not raised
+    assert state == {"errors": ErrorState()}
+    assert len(callback.calls) == 1
+
+    # Normal -> ErrorDetected: 再び異常となった場合は新しいアラートを登録する
+    state, raised = engine.transition(state, ErrorState.from_codes([5]), "t4", "gw")
+    assert raised == ErrorState.from_codes([5])
+    assert callback.calls[-1] == ("gw", ErrorState.from_codes([5]), "t4")
+
+
+def test_only_newly_raised_codes_are_reported():
+    callback = RecordingCallback()
+    engine = ErrorDetectorEngine(callback)
+
+    _, raised = engine.transition(
+        {"errors": ErrorState.from_codes([1, 2])},
+        ErrorState.from_codes([2, 3]),
+        "t1",
+        "gw",
+    )
+
+    assert raised == ErrorState.from_codes([3])
+    assert callback.calls == [("gw", ErrorState.from_codes([3]), "t1")]
+
+
+def test_callback_failure_propagates():
+    def failing_callback(key, raised, timestamp):
+        raise RuntimeError("insert failed")
+
+    engine = ErrorDetectorEngine(failing_callback)
+
+    with pytest.raises(RuntimeError):
+        engine.transition(None, ErrorState.from_codes([5]), "t1", "gw")
@@ -0,0 +1,200 @@
+from decimal import Decimal
+
+import pytest
+from botocore.exceptions import ClientError
+
+import aws_clients
+from error_state import ErrorState
+from error_state_store import (
+    DynamoDBStateStore,
+    MemoryStateStore,
+    StateConflictError,
+    create_state_store,
+    newer_samples,
+    restore_state,
+    update_state,
+)
+
+TABLE_NAME = "error_state_table"
+
+
+class StubTable:
+    """In-memory stand-in for the boto3 Table resource."""
+
+    def __init__(self):
+        self.items = {}
+
+    def get_item(self, Key, ConsistentRead=False):
+        item = self.items.get(Key["state_key"])
+        return {} if item is None else {"Item": dict(item)}
+
+    def put_item(self, Item, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues=None):
+        current = self.items.get(Item["state_key"], {})
+        if ConditionExpression == "attribute_not_exists(#version)":
+            matched = "version" not in current
+        else:
+            matched = current.get("version") == ExpressionAttributeValues[":version"]
+        if not matched:
+            raise ClientError(
+                {"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem"
+            )
+        self.items[Item["state_key"]] = dict(Item)
+
+
+@pytest.fixture
+def table():
+    table = StubTable()
+    aws_clients._tables[TABLE_NAME] = table
+    yield table
+    del aws_clients._tables[TABLE_NAME]
+
+
+def test_memory_store_round_trip():
+    store = MemoryStateStore()
+    state = {"errors": ErrorState.from_codes([1, 5]), "synced_at": 123.5}
+
+    saved = store.save("gw", state)
+
+    assert saved == {**state, "version": 1}
+    assert store.load("gw") == saved
+    assert store.load("other") is None
+
+
+def test_memory_store_returns_copies():
+    store = MemoryStateStore()
+    store.save("gw", {"errors": ErrorState.from_codes([1]), "synced_at": 1.0})
+
+    loaded = store.load("gw")
+    loaded["synced_at"] = 2.0
+
+    assert store.load("gw")["synced_at"] == 1.0
+
+
+def test_dynamodb_store_round_trip(table):
+    store = DynamoDBStateStore(TABLE_NAME)
+    state = {
+        "errors": ErrorState.from_codes([1, 5, 90]),
+        "synced_at": 123.5,
+        "timestamp": "2024-04-11T06:20:01.648000Z",
+    }
+
+    store.save("gw", state)
+
+    assert table.items["gw"]["errors"] == ErrorState.from_codes([1, 5, 90]).to_hex()
+    assert store.load("gw") == {**state, "version": 1}
+    assert store.load("other") is None
+
+
+def test_dynamodb_store_round_trip_with_pending(table):
+    store = DynamoDBStateStore(TABLE_NAME)
+    state = {
+        "errors": ErrorState.from_codes([2]),
+        "synced_at": 0.0,
+        "pending": {3: (100.25, 2), 7: (50.0, 1)},
+    }
+
+    store.save("gw#hysteresis", state)
+
+    assert store.load("gw#hysteresis") == {**state, "version": 1}
+
+
+def test_dynamodb_store_loads_error_code_lists(table):
+    table.items["gw"] = {
+        "state_key": "gw",
+        "errors": [Decimal(1), Decimal(3)],
+        "synced_at": Decimal("10"),
+    }
+
+    state = DynamoDBStateStore(TABLE_NAME).load("gw")
+
+    assert state == {
+        "errors": ErrorState.from_codes([1, 3]),
+        "synced_at": 10.0,
+        "version": 0,
+    }
+
+
+@pytest.mark.parametrize("store_type", ["memory", "dynamodb"])
+def test_store_rejects_stale_version(table, store_type):
+    store = (
+        MemoryStateStore() if store_type == "memory" else DynamoDBStateStore(TABLE_NAME)
+    )
+    store.save("gw", {"errors": ErrorState(), "synced_at": 0})
+    loaded = store.load("gw")
+
+    store.save("gw", {**loaded, "errors": ErrorState.from_codes([1])})
+
+    # 読み込んだ後に別の呼び出しが保存した場合は上書きしない
+    with pytest.raises(StateConflictError):
+        store.save("gw", {**loaded, "errors": ErrorState.from_codes([2])})
+    # 項目がない前提で保存した場合も上書きしない
+    with pytest.raises(StateConflictError):
+        store.save("gw", {"errors": ErrorState.from_codes([3]), "synced_at": 0})
+    assert store.load("gw")["errors"] == ErrorState.from_codes([1])
+
+
+def test_dynamodb_store_updates_items_without_version(table):
+    table.items["gw"] = {"state_key": "gw", "errors": "2", "synced_at": Decimal("0")}
+    store = DynamoDBStateStore(TABLE_NAME)
+
+    store.save("gw", {**store.load("gw"), "errors": ErrorState.from_codes([3])})
+
+    assert store.load("gw")["errors"] == ErrorState.from_codes([3])
+    assert store.load("gw")["version"] == 1
+
+
+def test_update_state_retries_on_conflict():
+    store = MemoryStateStore()
+    calls = []
+
+    def transition(state):
+        calls.append(state)
+        if len(calls) == 1:
+            # 読み込んだ後に別の呼び出しが保存した場合
+            store.save("gw", {"errors": ErrorState.from_codes([1]), "synced_at": 0})
+        previous = state["errors"] if state else ErrorState()
+        return {"errors": previous | ErrorState.from_codes([2]), "synced_at": 0}, "done"
+
+    previous, saved, result = update_state(store, "gw", transition)
+
+    assert len(calls) == 2
+    assert previous["errors"] == ErrorState.from_codes([1])
+    assert saved["errors"] == ErrorState.from_codes([1, 2])
+    assert result == "done"
+
+
+def test_update_state_does_not_save_without_changes():
+    store = MemoryStateStore()
+
+    previous, saved, result = update_state(store, "gw", lambda state: (None, []))
+
+    assert (previous, saved, result) == (None, None, [])
+    assert store.load("gw") is None
+
+
+def test_restore_state_keeps_newer_state():
+    store = MemoryStateStore()
+    saved = store.save("gw", {"errors": ErrorState.from_codes([1]), "synced_at": 0})
+    newer = store.save("gw", {**saved, "errors": ErrorState.from_codes([2])})
+
+    restore_state(store, "gw", saved, {"errors": ErrorState(), "synced_at": 0})
+    assert store.load("gw") == newer
+
+    restore_state(store, "gw", newer, {"errors": ErrorState(), "synced_at": 0})
+    assert store.load("gw")["errors"] == ErrorState()
+
+
+def test_newer_samples_skips_applied_timestamps():
+    samples = [(ErrorState(), "t1"), (ErrorState(), "t2"), (ErrorState(), "t3")]
+
+    assert newer_samples(None, samples) == samples
+    assert newer_samples({"timestamp": "t2"}, samples) == samples[2:]
+
+
+def test_create_state_store(monkeypatch):
+    monkeypatch.setenv("ERROR_STATE_TABLE_NAME", TABLE_NAME)
+
+    assert isinstance(create_state_store("memory"), MemoryStateStore)
+    assert isinstance(create_state_store("dynamodb"), DynamoDBStateStore)
+    with pytest.raises(ValueError):
+        create_state_store("redis")
@@ -0,0 +1,64 @@
+from boto3.dynamodb.conditions import ConditionExpressionBuilder
+
+import get_alerts
+
+
+class StubClient:
+    def __init__(self, items):
+        self.items = items
+        self.requests = []
+
+    def query(self, TableName, **kwargs):
+        self.requests.append(kwargs)
+        return {"Items": self.items}
+
+
+class StubMeta:
+    def __init__(self, client):
+        self.client = client
+
+
+class StubTable:
+    def __init__(self, items=()):
+        self.name = "alert_table"
+        self.meta = StubMeta(StubClient(list(items)))
+
+
+def alert_query(**query):
+    return {
+        "statuses": ["OPEN", "CLOSE"],
+        "severities": [],
+        "category": None,
+        "from": None,
+        "to": None,
+        **query,
+    }
+
+
+def filter_values(request) -> set:
+    expression = ConditionExpressionBuilder().build_expression(
+        request["FilterExpression"]
+    )
+    return set(expression.attribute_value_placeholders.values())
+
+
+def test_category_uses_category_index_when_available(monkeypatch):
+    monkeypatch.setattr(get_alerts, "CATEGORY_INDEX_NAME", "category-index")
+    table = StubTable()
+
+    get_alerts.query_alerts(table, 10, alert_query(category="PLC"), None, {})
+
+    [request] = table.meta.client.requests
+    assert request["IndexName"] == "category-index"
+    assert filter_values(request) == {"OPEN", "CLOSE"}
+
+
+def test_category_filters_status_index_without_category_index(monkeypatch):
+    monkeypatch.setattr(get_alerts, "CATEGORY_INDEX_NAME", None)
+    table = StubTable()
+
+    get_alerts.query_alerts(table, 10, alert_query(category="PLC"), None, {})
+
+    requests = table.meta.client.requests
+    assert [request["IndexName"] for request in requests] == ["status-index"] * 2
+    assert all(filter_values(request) == {"PLC"} for request in requests)
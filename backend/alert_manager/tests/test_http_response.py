@@ -0,0 +1,34 @@
+import sys
+from decimal import Decimal
+
+import pytest
+
+import http_response
+
+VALUE = {"count": Decimal("3"), "ratio": Decimal("0.5"), "tags": {"a"}, "name": "警報"}
+EXPECTED = '{"count":3,"ratio":0.5,"tags":["a"],"name":"警報"}'.encode("utf-8")
+
+
+@pytest.fixture(autouse=True)
+def reset_dumps(monkeypatch):
+    monkeypatch.setattr(http_response, "_dumps", None)
+
+
+def test_dumps_with_json(monkeypatch):
+    # orjson がない環境と同じく、import に失敗させる
+    monkeypatch.setitem(sys.modules, "orjson", None)
+
+    assert http_response.dumps(VALUE) == EXPECTED
+
+
+def test_dumps_with_orjson():
+    pytest.importorskip("orjson")
+
+    assert http_response.dumps(VALUE) == EXPECTED
+
+
+def test_dumps_rejects_unknown_types(monkeypatch):
+    monkeypatch.setitem(sys.modules, "orjson", None)
+
+    with pytest.raises(TypeError):
+        http_response.dumps({"value": object()})
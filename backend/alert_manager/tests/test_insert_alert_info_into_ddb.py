@@ -0,0 +1,65 @@
+import os
+import threading
+
+import pytest
+from botocore.exceptions import ClientError
+
+os.environ.setdefault("ALERT_INFO_TABLE_NAME", "alert_info_table")
+os.environ.setdefault("ERROR_CODE_TABLE_NAME", "error_info_table")
+
+from insert_alert_info_into_ddb import put_alerts  # noqa: E402
+
+
+class StubClient:
+    """Conditional put_item on the low-level client, from several threads at once."""
+
+    def __init__(self, parties):
+        self.items = {}
+        self.lock = threading.Lock()
+        # 並列に書き込まれない場合はタイムアウトする
+        self.barrier = threading.Barrier(parties, timeout=5)
+
+    def put_item(self, TableName, Item, ConditionExpression):
+        self.barrier.wait()
+        with self.lock:
+            if Item["id"] in self.items:
+                raise ClientError(
+                    {"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem"
+                )
+            self.items[Item["id"]] = Item
+        return {}
+
+
+class StubMeta:
+    def __init__(self, client):
+        self.client = client
+
+
+class StubTable:
+    def __init__(self, client):
+        self.name = "alert_info_table"
+        self.meta = StubMeta(client)
+
+
+def alert(alert_id):
+    return {"id": alert_id, "status": "OPEN"}
+
+
+def test_put_alerts_writes_concurrently_and_skips_existing():
+    client = StubClient(parties=3)
+    client.items["closed"] = {"id": "closed", "status": "CLOSED"}
+
+    inserted = put_alerts(StubTable(client), [alert("a"), alert("b"), alert("closed")])
+
+    assert inserted == 2
+    # 既に登録されていたアラートは上書きしない
+    assert client.items["closed"]["status"] == "CLOSED"
+
+
+def test_put_alerts_raises_other_errors():
+    class FailingClient(StubClient):
+        def put_item(self, TableName, Item, ConditionExpression):
+            raise ClientError({"Error": {"Code": "ValidationException"}}, "PutItem")
+
+    with pytest.raises(ClientError):
+        put_alerts(StubTable(FailingClient(parties=1)), [alert("a"), alert("b")])
@@ -0,0 +1,175 @@
+import os
+
+import pytest
+
+os.environ.setdefault("MAX_ERROR_ID", "90")
+os.environ.setdefault("ERROR_CODE_TOPIC_NAME", "plc/error/")
+
+import publish_error_topic  # noqa: E402
+from error_state import ErrorState  # noqa: E402
+from error_state_store import MemoryStateStore  # noqa: E402
+
+
+class InterleavingStore(MemoryStateStore):
+    """Runs another invocation right after the first load, as overlapping Lambda invocations do."""
+
+    def __init__(self):
+        super().__init__()
+        self.on_first_load = None
+
+    def load(self, key):
+        state = super().load(key)
+        if self.on_first_load is not None:
+            on_first_load, self.on_first_load = self.on_first_load, None
+            on_first_load()
+        return state
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = InterleavingStore()
+    monkeypatch.setattr(publish_error_topic, "state_store", store)
+    monkeypatch.setattr(publish_error_topic, "hysteresis", None)
+    return store
+
+
+@pytest.fixture
+def alerts(monkeypatch):
+    monkeypatch.setattr(publish_error_topic, "PUBLISH_MODE", "inprocess")
+    alerts = []
+    monkeypatch.setattr(
+        publish_error_topic.detector_engine,
+        "on_error_detected",
+        lambda key, raised, timestamp: alerts.append((key, list(raised), timestamp)),
+    )
+    return alerts
+
+
+def event(timestamp, *error_codes):
+    return {"timestamp": timestamp, "error": list(error_codes), "gateway_id": "gw"}
+
+
+def test_overlapping_invocations_insert_one_alert(store, alerts):
+    store.on_first_load = lambda: publish_error_topic.handler(
+        event("20240411 15:20:01.000", "5"), None
+    )
+
+    publish_error_topic.handler(event("20240411 15:20:02.000", "5"), None)
+
+    assert alerts == [("gw", [5], "2024-04-11T06:20:01.000000Z")]
+    assert store.load("gw")["timestamp"] == "2024-04-11T06:20:02.000000Z"
+
+
+def test_older_message_is_skipped(store, alerts):
+    publish_error_topic.handler(event("20240411 15:20:02.000", "5"), None)
+    publish_error_topic.handler(event("20240411 15:20:03.000", "1"), None)
+
+    # 後から届いた古いメッセージで状態を戻さない
+    publish_error_topic.handler(event("20240411 15:20:01.000", "5"), None)
+
+    assert [raised for _, raised, _ in alerts] == [[5], [1]]
+    assert store.load("gw")["errors"] == ErrorState.from_codes([1])
+
+
+def test_failed_insert_restores_state(store, alerts, monkeypatch):
+    failures = [RuntimeError("insert failed")]
+
+    def insert(key, raised, timestamp):
+        if failures:
+            raise failures.pop()
+        alerts.append((key, list(raised), timestamp))
+
+    monkeypatch.setattr(publish_error_topic.detector_engine, "on_error_detected", insert)
+    with pytest.raises(RuntimeError):
+        publish_error_topic.handler(event("20240411 15:20:01.000", "5"), None)
+    assert store.load("gw")["errors"] == ErrorState()
+
+    # 再試行で同じ遷移を検知し直す
+    publish_error_topic.handler(event("20240411 15:20:01.000", "5"), None)
+
+    assert alerts == [("gw", [5], "2024-04-11T06:20:01.000000Z")]
+
+
+def test_overlapping_delta_invocations_publish_from_saved_state(store, monkeypatch):
+    monkeypatch.setattr(publish_error_topic, "PUBLISH_MODE", "delta")
+    monkeypatch.setattr(publish_error_topic, "RESYNC_INTERVAL_SECONDS", 0)
+    published = []
+
+    async def send(errors, timestamp, error_codes=None, context=None, gateway_id=None):
+        published.append((timestamp, error_codes))
+        return {"published": len(error_codes or []), "retries": 0, "throttled": 0, "dropped": 0}
+
+    monkeypatch.setattr(publish_error_topic, "send_error_data_to_errortopic", send)
+    publish_error_topic.handler(event("20240411 15:20:00.000", "1"), None)
+    store.on_first_load = lambda: publish_error_topic.handler(
+        event("20240411 15:20:01.000", "5"), None
+    )
+
+    publish_error_topic.handler(event("20240411 15:20:02.000", "7"), None)
+
+    # 後の呼び出しは、先に保存された状態(5 が異常)からの変化を送信する
+    assert published[1:] == [
+        ("2024-04-11T06:20:01.000000Z", [1, 5]),
+        ("2024-04-11T06:20:02.000000Z", [5, 7]),
+    ]
+
+
+def sqs_event(*bodies):
+    return {
+        "Records": [
+            {"messageId": str(i), "body": body} for i, body in enumerate(bodies)
+        ]
+    }
+
+
+def test_batch_reports_only_failed_records(store, alerts, monkeypatch):
+    monkeypatch.setattr(publish_error_topic, "_batch_state_store", store)
+
+    response = publish_error_topic.batch_handler(
+        sqs_event(
+            '{"timestamp": "20240411 15:20:01.000", "error": ["5"], "gateway_id": "gw"}',
+            "not json",
+            '{"timestamp": "invalid", "error": ["5"], "gateway_id": "gw"}',
+        ),
+        None,
+    )
+
+    assert response == {
+        "batchItemFailures": [{"itemIdentifier": "1"}, {"itemIdentifier": "2"}]
+    }
+    assert alerts == [("gw", [5], "2024-04-11T06:20:01.000000Z")]
+
+
+def test_batch_reports_failed_gateway(store, alerts, monkeypatch):
+    monkeypatch.setattr(publish_error_topic, "_batch_state_store", store)
+
+    def insert(key, raised, timestamp):
+        if key == "broken":
+            raise RuntimeError("insert failed")
+        alerts.append((key, list(raised), timestamp))
+
+    monkeypatch.setattr(publish_error_topic.detector_engine, "on_error_detected", insert)
+
+    response = publish_error_topic.batch_handler(
+        sqs_event(
+            '{"timestamp": "20240411 15:20:01.000", "error": ["5"], "gateway_id": "broken"}',
+            '{"timestamp": "20240411 15:20:01.000", "error": ["5"], "gateway_id": "gw"}',
+        ),
+        None,
+    )
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "0"}]}
+    assert alerts == [("gw", [5], "2024-04-11T06:20:01.000000Z")]
+
+
+def test_batch_skips_messages_older_than_applied(store, alerts, monkeypatch):
+    monkeypatch.setattr(publish_error_topic, "_batch_state_store", store)
+    newer = '{"timestamp": "20240411 15:20:02.000", "error": ["1"], "gateway_id": "gw"}'
+    older = '{"timestamp": "20240411 15:20:01.000", "error": ["5"], "gateway_id": "gw"}'
+
+    publish_error_topic.batch_handler(sqs_event(newer), None)
+    # 標準キューでは古いメッセージのバッチが後から処理されることがある
+    publish_error_topic.batch_handler(sqs_event(older), None)
+
+    assert [raised for _, raised, _ in alerts] == [[1]]
+    assert store.load("gw")["errors"] == ErrorState.from_codes([1])
@@ -7,10 +7,26 @@ import * as dynamodb from "aws-cdk-lib/aws-dynamodb";
 import * as trigger from "aws-cdk-lib/triggers";
 import * as timestream from "aws-cdk-lib/aws-timestream";
 import * as iam from "aws-cdk-lib/aws-iam";
+import { DynamoEventSource } from "aws-cdk-lib/aws-lambda-event-sources";
 
 export interface AlertsTimeseriesApiProps {
   readonly alertsTable: dynamodb.TableV2;
+  /**
+   * Name of the category GSI of alertsTable. Without it GET /alerts filters "status-index" by category.
+   * @default - no category index
+   */
+  readonly alertCategoryIndexName?: string;
+  /**
+   * Table of the alert counters and of the alerts table version, kept up to date from the stream of alertsTable.
+   * The version is also bumped by every alert write path and keys the cached alert list of GET /alerts.
+   */
+  readonly alertSummaryTable: dynamodb.TableV2;
   readonly auth: Auth;
+  readonly commonLayer: lambda.ILayerVersion;
+  /**
+   * Error code table used to expand alerts stored in the compact encoding.
+   */
+  readonly errorTable?: dynamodb.ITableV2;
   readonly timeseriesDatabase: timestream.CfnDatabase;
   readonly timeseriesTable: timestream.CfnTable;
 }
@@ -24,6 +40,8 @@ export class AlertsTimeseriesApi extends Construct {
     // API Gateway resource　-----------------------------------------------
     const api = new apigw.RestApi(this, "ServerlessRestApi", {
       cloudWatchRole: false,
+      // Lambda functions return gzip-compressed bodies as base64, which API Gateway converts back to binary.
+      binaryMediaTypes: ["*/*"],
       defaultCorsPreflightOptions: {
         allowOrigins: apigw.Cors.ALL_ORIGINS,
         allowMethods: apigw.Cors.ALL_METHODS,
@@ -48,6 +66,8 @@ export class AlertsTimeseriesApi extends Construct {
     const alerts = api.root.addResource("alerts");
     // path : "/alerts/<alert_id>"
     const alert = alerts.addResource("{alert_id}");
+    // path : "/alerts/summary"
+    const alertSummary = alerts.addResource("summary");
     // path : "/plc/loops/<loop_name>"
     const plc = api.root
       .addResource("plc")
@@ -62,12 +82,31 @@ export class AlertsTimeseriesApi extends Construct {
       runtime: lambda.Runtime.PYTHON_3_11,
       code: lambda.Code.fromAsset("../backend/alert_manager/lambda/alerts_api"),
       handler: "get_alerts.handler",
+      layers: [props.commonLayer],
       environment: {
         TABLE_NAME: alertsTableName,
       },
     });
     // grant lambda function the permission to write and read AlertsDB
     props.alertsTable.grantReadWriteData(getAlertsFunction);
+    getAlertsFunction.addEnvironment(
+      "SUMMARY_TABLE_NAME",
+      props.alertSummaryTable.tableName
+    );
+    props.alertSummaryTable.grantReadData(getAlertsFunction);
+    if (props.alertCategoryIndexName) {
+      getAlertsFunction.addEnvironment(
+        "CATEGORY_INDEX_NAME",
+        props.alertCategoryIndexName
+      );
+    }
+    if (props.errorTable) {
+      getAlertsFunction.addEnvironment(
+        "ERROR_CODE_TABLE_NAME",
+        props.errorTable.tableName
+      );
+      props.errorTable.grantReadData(getAlertsFunction);
+    }
     // Add APIGW to lambda function
     alerts.addMethod("GET", new apigw.LambdaIntegration(getAlertsFunction), {
       authorizationType: apigw.AuthorizationType.COGNITO,
@@ -86,6 +125,7 @@ export class AlertsTimeseriesApi extends Construct {
           "../backend/alert_manager/lambda/alerts_api"
         ),
         handler: "delete_alerts.handler",
+        layers: [props.commonLayer],
         environment: {
           TABLE_NAME: alertsTableName,
         },
@@ -93,6 +133,11 @@ export class AlertsTimeseriesApi extends Construct {
     );
     // grant lambda function the permission to write and read AlertsDB
     props.alertsTable.grantReadWriteData(deleteAlertsFunction);
+    deleteAlertsFunction.addEnvironment(
+      "SUMMARY_TABLE_NAME",
+      props.alertSummaryTable.tableName
+    );
+    props.alertSummaryTable.grantWriteData(deleteAlertsFunction);
     // Add APIGW to lambda function
     alerts.addMethod(
       "DELETE",
@@ -103,6 +148,87 @@ export class AlertsTimeseriesApi extends Construct {
       }
     );
 
+    // path : "/alerts/summary"
+    // method : "GET"
+    // lambda function resource　-----------------------------------------------
+    const getAlertSummaryFunction = new lambda.Function(
+      this,
+      "GetAlertSummaryFunction",
+      {
+        runtime: lambda.Runtime.PYTHON_3_11,
+        code: lambda.Code.fromAsset(
+          "../backend/alert_manager/lambda/alerts_api"
+        ),
+        handler: "get_alert_summary.handler",
+        layers: [props.commonLayer],
+        environment: {
+          SUMMARY_TABLE_NAME: props.alertSummaryTable.tableName,
+        },
+      }
+    );
+    props.alertSummaryTable.grantReadData(getAlertSummaryFunction);
+    // Add APIGW to lambda function
+    alertSummary.addMethod(
+      "GET",
+      new apigw.LambdaIntegration(getAlertSummaryFunction),
+      {
+        authorizationType: apigw.AuthorizationType.COGNITO,
+        authorizer,
+      }
+    );
+
+    // Update the alert counters from the stream of the alerts table.
+    // The stream also carries the writes of the NestJS API, which updates and deletes alerts directly.
+    const updateAlertSummaryFunction = new lambda.Function(
+      this,
+      "UpdateAlertSummaryFunction",
+      {
+        runtime: lambda.Runtime.PYTHON_3_11,
+        code: lambda.Code.fromAsset(
+          "../backend/alert_manager/lambda/alerts_api"
+        ),
+        handler: "update_alert_summary.handler",
+        layers: [props.commonLayer],
+        environment: {
+          SUMMARY_TABLE_NAME: props.alertSummaryTable.tableName,
+        },
+      }
+    );
+    props.alertSummaryTable.grantWriteData(updateAlertSummaryFunction);
+    updateAlertSummaryFunction.addEventSource(
+      new DynamoEventSource(props.alertsTable, {
+        startingPosition: lambda.StartingPosition.TRIM_HORIZON,
+        batchSize: 100,
+        maxBatchingWindow: cdk.Duration.seconds(1),
+        retryAttempts: 3,
+      })
+    );
+
+    // Rebuild the alert counters from a full scan of the alerts table when they drift.
+    // Invoke it manually: aws lambda invoke --function-name <RebuildAlertSummaryFunctionName> out.json
+    const rebuildAlertSummaryFunction = new lambda.Function(
+      this,
+      "RebuildAlertSummaryFunction",
+      {
+        runtime: lambda.Runtime.PYTHON_3_11,
+        code: lambda.Code.fromAsset(
+          "../backend/alert_manager/lambda/alerts_api"
+        ),
+        handler: "rebuild_alert_summary.handler",
+        layers: [props.commonLayer],
+        environment: {
+          TABLE_NAME: alertsTableName,
+          SUMMARY_TABLE_NAME: props.alertSummaryTable.tableName,
+        },
+        timeout: cdk.Duration.minutes(5),
+      }
+    );
+    props.alertsTable.grantReadData(rebuildAlertSummaryFunction);
+    props.alertSummaryTable.grantWriteData(rebuildAlertSummaryFunction);
+    new cdk.CfnOutput(this, "RebuildAlertSummaryFunctionName", {
+      value: rebuildAlertSummaryFunction.functionName,
+    });
+
     // path : "/alerts/<alert_id>"
     // method : "GET"
     // lambda function resource　-----------------------------------------------
@@ -115,6 +241,7 @@ export class AlertsTimeseriesApi extends Construct {
           "../backend/alert_manager/lambda/alerts_api"
         ),
         handler: "get_alert_by_id.handler",
+        layers: [props.commonLayer],
         environment: {
           TABLE_NAME: alertsTableName,
         },
@@ -122,6 +249,13 @@ export class AlertsTimeseriesApi extends Construct {
     );
     // grant lambda function the permission to write and read AlertsDB
     props.alertsTable.grantReadWriteData(getAlertByIdFunction);
+    if (props.errorTable) {
+      getAlertByIdFunction.addEnvironment(
+        "ERROR_CODE_TABLE_NAME",
+        props.errorTable.tableName
+      );
+      props.errorTable.grantReadData(getAlertByIdFunction);
+    }
     // Add APIGW to lambda function
     alert.addMethod("GET", new apigw.LambdaIntegration(getAlertByIdFunction), {
       authorizationType: apigw.AuthorizationType.COGNITO,
@@ -140,6 +274,7 @@ export class AlertsTimeseriesApi extends Construct {
           "../backend/alert_manager/lambda/alerts_api"
         ),
         handler: "put_alert_by_id.handler",
+        layers: [props.commonLayer],
         environment: {
           TABLE_NAME: alertsTableName,
         },
@@ -147,6 +282,11 @@ export class AlertsTimeseriesApi extends Construct {
     );
     // grant lambda function the permission to write and read AlertsDB
     props.alertsTable.grantReadWriteData(putAlertByIdFunction);
+    putAlertByIdFunction.addEnvironment(
+      "SUMMARY_TABLE_NAME",
+      props.alertSummaryTable.tableName
+    );
+    props.alertSummaryTable.grantWriteData(putAlertByIdFunction);
     // Add APIGW to lambda function
     alert.addMethod("PUT", new apigw.LambdaIntegration(putAlertByIdFunction), {
       authorizationType: apigw.AuthorizationType.COGNITO,
@@ -165,6 +305,7 @@ export class AlertsTimeseriesApi extends Construct {
           "../backend/alert_manager/lambda/alerts_api"
         ),
         handler: "delete_alert_by_id.handler",
+        layers: [props.commonLayer],
         environment: {
           TABLE_NAME: alertsTableName,
         },
@@ -172,6 +313,11 @@ export class AlertsTimeseriesApi extends Construct {
     );
     // grant lambda function the permission to write and read AlertsDB
     props.alertsTable.grantReadWriteData(deleteAlertByIdFunction);
+    deleteAlertByIdFunction.addEnvironment(
+      "SUMMARY_TABLE_NAME",
+      props.alertSummaryTable.tableName
+    );
+    props.alertSummaryTable.grantWriteData(deleteAlertByIdFunction);
     // Add APIGW to lambda function
     alert.addMethod(
       "DELETE",
@@ -191,6 +337,7 @@ export class AlertsTimeseriesApi extends Construct {
         "../backend/alert_manager/lambda/plc_data_api"
       ),
       handler: "get_plc_data.handler",
+      layers: [props.commonLayer],
       environment: {
         DATABASE_NAME: props.timeseriesDatabase.databaseName!,
         TABLE_NAME: props.timeseriesTable.tableName!,
@@ -220,17 +367,34 @@ export class AlertsTimeseriesApi extends Construct {
           "../backend/alert_manager/lambda/alerts_api"
         ),
         handler: "insert_initial_data_into_ddb.handler",
+        layers: [props.commonLayer],
         environment: {
           TABLE_NAME: alertsTableName,
         },
       }
     );
     props.alertsTable.grantWriteData(insertInitialDataIntoDDBFunction);
+    insertInitialDataIntoDDBFunction.addEnvironment(
+      "SUMMARY_TABLE_NAME",
+      props.alertSummaryTable.tableName
+    );
+    props.alertSummaryTable.grantWriteData(insertInitialDataIntoDDBFunction);
     new trigger.Trigger(this, "Trigger", {
       handler: insertInitialDataIntoDDBFunction,
       executeAfter: [],
     });
 
+    // With binaryMediaTypes "*/*", the mock integrations of CORS preflight requests
+    // have to convert the request to text to render their response templates.
+    api.methods
+      .filter((method) => method.httpMethod === "OPTIONS")
+      .forEach((method) => {
+        (method.node.defaultChild as apigw.CfnMethod).addPropertyOverride(
+          "Integration.ContentHandling",
+          "CONVERT_TO_TEXT"
+        );
+      });
+
     this.apiEndpoint = api.url;
   }
 }
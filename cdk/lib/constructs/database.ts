@@ -4,13 +4,29 @@ import * as timestream from "aws-cdk-lib/aws-timestream";
 import { CfnOutput, RemovalPolicy } from "aws-cdk-lib";
 import * as iam from "aws-cdk-lib/aws-iam";
 
+export interface DatabaseProps {
+  /**
+   * Create the "category-index" GSI on the alert table, which lets GET /alerts query alerts of a category
+   * directly. Without it the API queries "status-index" and filters by category.
+   * DynamoDB creates only one GSI per table update, so on a stack whose alert table does not have
+   * "status-index" yet, deploy once without this index and enable it in a later deployment.
+   * @default false
+   */
+  readonly categoryIndex?: boolean;
+}
+
 export class Database extends Construct {
   public readonly alertTable: ddb.TableV2;
+  /**
+   * Name of the category GSI of alertTable, or undefined when it is not created.
+   */
+  public readonly alertCategoryIndexName?: string;
+  public readonly alertSummaryTable: ddb.TableV2;
   public readonly meetingTable: ddb.TableV2;
   public readonly timeseriesDatabase: timestream.CfnDatabase;
   public readonly timeseriesTable:timestream.CfnTable; 
 
-  constructor(scope: Construct, id: string) {
+  constructor(scope: Construct, id: string, props: DatabaseProps = {}) {
     super(scope, id);
 
     const alertTable = new ddb.TableV2(this, "AlertTable", {
@@ -20,6 +36,48 @@ export class Database extends Construct {
       },
       billing: ddb.Billing.onDemand(),
       removalPolicy: RemovalPolicy.DESTROY,
+      // Consumed by the alerts API to keep the alert counters of alertSummaryTable up to date.
+      dynamoStream: ddb.StreamViewType.NEW_AND_OLD_IMAGES,
+    });
+    // Used by the alerts API to list alerts of a status, newest first.
+    alertTable.addGlobalSecondaryIndex({
+      indexName: "status-index",
+      partitionKey: {
+        name: "status",
+        type: ddb.AttributeType.STRING,
+      },
+      sortKey: {
+        name: "openedAt",
+        type: ddb.AttributeType.STRING,
+      },
+    });
+    // Used by the alerts API to filter alerts by category and openedAt range.
+    // DynamoDB creates only one GSI per table update, so it is opt-in and enabled after "status-index" exists.
+    if (props.categoryIndex) {
+      alertTable.addGlobalSecondaryIndex({
+        indexName: "category-index",
+        partitionKey: {
+          name: "category",
+          type: ddb.AttributeType.STRING,
+        },
+        sortKey: {
+          name: "openedAt",
+          type: ddb.AttributeType.STRING,
+        },
+      });
+      this.alertCategoryIndexName = "category-index";
+    }
+
+    // Holds the alert counters by status, severity and category served by GET /alerts/summary,
+    // and the version of alertTable that keys the cached alert list of GET /alerts.
+    // Kept out of alertTable so that scans of the alerts do not see the counter item.
+    const alertSummaryTable = new ddb.TableV2(this, "AlertSummaryTable", {
+      partitionKey: {
+        name: "id",
+        type: ddb.AttributeType.STRING,
+      },
+      billing: ddb.Billing.onDemand(),
+      removalPolicy: RemovalPolicy.DESTROY,
     });
 
     const meetingTable = new ddb.TableV2(this, "MeetingTable", {
@@ -65,6 +123,7 @@ export class Database extends Construct {
     });
 
     this.alertTable = alertTable;
+    this.alertSummaryTable = alertSummaryTable;
     this.meetingTable = meetingTable;
     this.timeseriesDatabase = timeseriesDatabase;
     this.timeseriesTable = timeseriesTable;
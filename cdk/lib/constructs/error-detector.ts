@@ -5,21 +5,117 @@ import * as iot from "aws-cdk-lib/aws-iot";
 import * as iotEvents from "aws-cdk-lib/aws-iotevents";
 import * as lambda from "aws-cdk-lib/aws-lambda";
 import * as logs from "aws-cdk-lib/aws-logs";
+import * as sqs from "aws-cdk-lib/aws-sqs";
+import * as kinesis from "aws-cdk-lib/aws-kinesis";
+import {
+  KinesisEventSource,
+  SqsDlq,
+  SqsEventSource,
+} from "aws-cdk-lib/aws-lambda-event-sources";
 import * as dynamodb from "aws-cdk-lib/aws-dynamodb";
 import * as trigger from "aws-cdk-lib/triggers";
 
 export interface ErrorDetectorProps {
   readonly alertsTable: dynamodb.TableV2;
+  /**
+   * Table holding the version of the alerts table, bumped after alerts are inserted
+   * so that the alerts API stops serving its cached alert list.
+   */
+  readonly alertSummaryTable?: dynamodb.ITableV2;
+  /**
+   * Layer containing the Python modules shared by the alert manager Lambda functions.
+   */
+  readonly commonLayer: lambda.ILayerVersion;
   readonly errordbTableName?: string;
   readonly ruleName?: string;
+  /**
+   * "full": publish the state of every error code on each PLC message.
+   * "delta": publish only the error codes whose state has changed.
+   * "aggregate": publish one message per PLC message listing every active error code as a bitmap.
+   * "inprocess": detect Normal -> ErrorDetected transitions inside the publish Lambda function
+   * and insert the alerts directly, without publishing to IoT Events. Requires the "dynamodb" state store.
+   * @default "full"
+   */
+  readonly publishMode?: "full" | "delta" | "aggregate" | "inprocess";
+  /**
+   * Interval to republish the state of every error code in "delta" mode. 0 disables it.
+   * With the "memory" state store each warm container diffs against the states it published itself,
+   * so when several containers serve the same gateway a container can miss a change published by another
+   * one (e.g. A publishes code 5 abnormal, B publishes it normal, A receives code 5 again and sees no diff).
+   * With the "dynamodb" state store the saves are ordered, but the publishes of overlapping invocations
+   * can still reach IoT Events out of order, leaving a detector in the older state until the code changes again.
+   * The periodic resync bounds how long the detectors can stay out of sync.
+   * @default 0 with "stream" ingestion, which processes each gateway in order, otherwise 60
+   */
+  readonly resyncIntervalSeconds?: number;
+  /**
+   * Where the last published error states are kept in "delta" and "inprocess" mode,
+   * and across batches in "batch" and "stream" ingestion.
+   * "memory" keeps them in the warm Lambda container, "dynamodb" persists them in a table.
+   * Consecutive batches of a gateway can be processed by different containers, so "batch" and "stream"
+   * ingestion require "dynamodb". The state is saved with a condition on its version, so that concurrent
+   * invocations for the same gateway do not overwrite each other's state. So does "inprocess" mode: a cold container without the detector state
+   * would raise a second alert for every error code that is already ErrorDetected.
+   * @default "dynamodb" with "batch" or "stream" ingestion or in "inprocess" mode, otherwise "memory"
+   */
+  readonly stateStore?: "memory" | "dynamodb";
+  /**
+   * "direct": invoke the publish Lambda function once per PLC message from the IoT rule.
+   * "batch": buffer PLC messages in an SQS queue and publish only the state transitions of each batch.
+   * The standard queue does not keep order and batches of the same gateway can run concurrently, so a message
+   * older than the last one applied for its gateway is dropped. Use "stream" when every message must be applied.
+   * "stream": put PLC messages into a Kinesis data stream partitioned by gateway, so that each shard
+   * processes the messages of its gateways in order and detector throughput scales with the shard count.
+   * In both modes only the records that failed are retried, and records that keep failing are sent to a dead-letter queue.
+   * @default "direct"
+   */
+  readonly ingestion?: "direct" | "batch" | "stream";
+  /**
+   * Number of Kinesis shards in "stream" ingestion.
+   * @default 1
+   */
+  readonly streamShardCount?: number;
+  /**
+   * Hysteresis applied to error codes before publishing, to suppress flapping codes.
+   * e.g. { default: { min_off_seconds: 30, off_count: 5 }, codes: { "12": { on_count: 3 } } }
+   * @default - no hysteresis
+   */
+  readonly hysteresisConfig?: HysteresisConfig;
+  /**
+   * "full": store alerts with every attribute.
+   * "compact": omit empty attributes and error catalog text, which the Python alerts API expands on read.
+   * The NestJS API reads the alerts table directly, so keep "full" while it is in use.
+   * @default "full"
+   */
+  readonly alertEncoding?: "full" | "compact";
+}
+
+export interface HysteresisRule {
+  readonly min_on_seconds?: number;
+  readonly on_count?: number;
+  readonly min_off_seconds?: number;
+  readonly off_count?: number;
+}
+
+export interface HysteresisConfig {
+  readonly default?: HysteresisRule;
+  readonly codes?: { [errorCode: string]: HysteresisRule };
 }
 
 export class ErrorDetector extends Construct {
   /**
    * Define IoT Core rule and IoT Events to insert alert info into DynamoDB.
+   *
+   * Migration: stacks deployed before detectors were keyed per gateway have the "ErrorDetectorModel"
+   * detector model keyed by "error". Updating such a stack replaces it with "GatewayErrorDetectorModel",
+   * and every detector in the ErrorDetected state is lost with the old model. On the first abnormal sample
+   * after the deployment, each ongoing error opens a second OPEN alert, this time with a gatewayId.
+   * Deploy while no error is active, or close the alerts opened before the deployment once their new
+   * alerts appear (see docs/deploy.md).
    */
 
   public readonly iotEventsRole: iam.Role;
+  public readonly errorTable: dynamodb.TableV2;
   constructor(scope: Construct, id: string, props: ErrorDetectorProps) {
     super(scope, id);
 
@@ -29,6 +125,43 @@ export class ErrorDetector extends Construct {
       removalPolicy: cdk.RemovalPolicy.DESTROY,
     });
     const errordbTableName = props.errordbTableName || "error_info_table";
+    const publishMode = props.publishMode || "full";
+    const ingestion = props.ingestion || "direct";
+    const stateStore =
+      props.stateStore ||
+      (ingestion === "direct" && publishMode !== "inprocess"
+        ? "memory"
+        : "dynamodb");
+    if (ingestion !== "direct" && stateStore !== "dynamodb") {
+      throw new Error(
+        `ingestion "${ingestion}" requires stateStore "dynamodb": ` +
+          "batches of the same gateway can be processed by different Lambda containers."
+      );
+    }
+    // IoT Events keeps the detector state centrally. The in-process detector has to persist it as well,
+    // otherwise a cold container treats every active error code as newly detected and duplicates open alerts.
+    // Unlike the SERIAL evaluation of IoT Events, invocations for the same gateway can overlap, so the state is
+    // saved with a condition on its version and alerts are inserted only by the invocation whose save succeeded.
+    // Messages older than the last applied one are skipped.
+    if (publishMode === "inprocess" && stateStore !== "dynamodb") {
+      throw new Error(
+        'publishMode "inprocess" requires stateStore "dynamodb": ' +
+          "a container without the detector state would raise the open alerts again."
+      );
+    }
+    const resyncIntervalSeconds =
+      props.resyncIntervalSeconds ?? (ingestion === "stream" ? 0 : 60);
+    if (
+      publishMode === "delta" &&
+      ingestion !== "stream" &&
+      resyncIntervalSeconds === 0
+    ) {
+      cdk.Annotations.of(this).addWarning(
+        "publishMode \"delta\" without resync can leave IoT Events detectors out of sync " +
+          "when invocations for the same gateway overlap. " +
+          "Set resyncIntervalSeconds or use ingestion \"stream\"."
+      );
+    }
 
     const errActionRole = new iam.Role(this, "ErrorActionRole", {
       assumedBy: new iam.ServicePrincipal("iot.amazonaws.com"),
@@ -67,12 +200,15 @@ export class ErrorDetector extends Construct {
           "../backend/alert_manager/lambda/error_detector"
         ),
         handler: "insert_alert_info_into_ddb.handler",
+        layers: [props.commonLayer],
         environment: {
           ALERT_INFO_TABLE_NAME: props.alertsTable.tableName,
           ERROR_CODE_TABLE_NAME: errorTable.tableName,
+          ALERT_ENCODING: props.alertEncoding || "full",
         },
       }
     );
+    this.errorTable = errorTable;
 
     // Publish error topic when data arrived at IoT Core.
     const publishErrorTopicFunction = new lambda.Function(
@@ -83,15 +219,52 @@ export class ErrorDetector extends Construct {
         code: lambda.Code.fromAsset(
           "../backend/alert_manager/lambda/error_detector"
         ),
-        handler: "publish_error_topic.handler",
+        layers: [props.commonLayer],
+        handler:
+          ingestion === "direct"
+            ? "publish_error_topic.handler"
+            : "publish_error_topic.batch_handler",
+        timeout:
+          ingestion === "direct"
+            ? cdk.Duration.seconds(3)
+            : cdk.Duration.minutes(1),
         environment: {
           MAX_ERROR_ID: "90",
           ERROR_CODE_TOPIC_NAME: "plc/error/",
+          ERROR_STATUS_TOPIC_NAME: "plc/error_status",
+          PUBLISH_MAX_CONCURRENCY: "10",
+          PUBLISH_MODE: publishMode,
+          RESYNC_INTERVAL_SECONDS: String(resyncIntervalSeconds),
+          STATE_STORE: stateStore,
         },
         memorySize: 512,
       }
     );
 
+    if (props.hysteresisConfig) {
+      publishErrorTopicFunction.addEnvironment(
+        "HYSTERESIS_CONFIG",
+        JSON.stringify(props.hysteresisConfig)
+      );
+    }
+
+    // Keep the last published error states across Lambda containers.
+    // The table is created whenever the dynamodb store is selected, since batch ingestion uses it in every mode.
+    if (stateStore === "dynamodb") {
+      const errorStateTable = new dynamodb.TableV2(this, "ErrorStateTable", {
+        partitionKey: {
+          name: "state_key",
+          type: dynamodb.AttributeType.STRING,
+        },
+        removalPolicy: cdk.RemovalPolicy.DESTROY,
+      });
+      publishErrorTopicFunction.addEnvironment(
+        "ERROR_STATE_TABLE_NAME",
+        errorStateTable.tableName
+      );
+      errorStateTable.grantReadWriteData(publishErrorTopicFunction);
+    }
+
     // attach pocicy to  publicErrorTopic Functions
     publishErrorTopicFunction.role?.addManagedPolicy(
       iam.ManagedPolicy.fromAwsManagedPolicyName("AWSIoTFullAccess")
@@ -107,6 +280,9 @@ export class ErrorDetector extends Construct {
           "../backend/alert_manager/lambda/error_detector"
         ),
         handler: "insert_error_info_into_ddb.handler",
+        layers: [props.commonLayer],
+        // Large catalogs are written in parallel batches, which can take longer than the default timeout.
+        timeout: cdk.Duration.minutes(5),
         environment: {
           ERROR_CODE_TABLE_NAME: errorTable.tableName,
         },
@@ -116,9 +292,40 @@ export class ErrorDetector extends Construct {
     // Grant write/read permissions to DynamoDB for various Lambda functions
     errorTable.grantReadData(insertAlertIntoDbFunction);
     errorTable.grantReadData(publishErrorTopicFunction);
-    errorTable.grantWriteData(insertInitialErrorDataIntoDbFunction);
+    // The catalog loader scans the table to write only the changed error codes.
+    errorTable.grantReadWriteData(insertInitialErrorDataIntoDbFunction);
 
     props.alertsTable.grantReadWriteData(insertAlertIntoDbFunction);
+    if (props.alertSummaryTable) {
+      insertAlertIntoDbFunction.addEnvironment(
+        "SUMMARY_TABLE_NAME",
+        props.alertSummaryTable.tableName
+      );
+      props.alertSummaryTable.grantWriteData(insertAlertIntoDbFunction);
+    }
+    // The in-process detector inserts alerts from the publish Lambda function itself.
+    if (publishMode === "inprocess") {
+      publishErrorTopicFunction.addEnvironment(
+        "ALERT_INFO_TABLE_NAME",
+        props.alertsTable.tableName
+      );
+      publishErrorTopicFunction.addEnvironment(
+        "ERROR_CODE_TABLE_NAME",
+        errorTable.tableName
+      );
+      publishErrorTopicFunction.addEnvironment(
+        "ALERT_ENCODING",
+        props.alertEncoding || "full"
+      );
+      props.alertsTable.grantReadWriteData(publishErrorTopicFunction);
+      if (props.alertSummaryTable) {
+        publishErrorTopicFunction.addEnvironment(
+          "SUMMARY_TABLE_NAME",
+          props.alertSummaryTable.tableName
+        );
+        props.alertSummaryTable.grantWriteData(publishErrorTopicFunction);
+      }
+    }
     props.alertsTable.grantWriteData(insertInitialErrorDataIntoDbFunction);
 
     // Insert initial demo data into DynamoDB
@@ -128,6 +335,87 @@ export class ErrorDetector extends Construct {
       executeAfter: [],
     });
 
+    // In "batch" mode, PLC messages are buffered in an SQS queue and processed in batches.
+    let plcDataAction: iot.CfnTopicRule.ActionProperty = {
+      lambda: {
+        functionArn: publishErrorTopicFunction.functionArn,
+      },
+    };
+    if (ingestion === "batch") {
+      const plcDataDeadLetterQueue = new sqs.Queue(
+        this,
+        "PlcDataDeadLetterQueue",
+        {
+          enforceSSL: true,
+        }
+      );
+      const plcDataQueue = new sqs.Queue(this, "PlcDataQueue", {
+        visibilityTimeout: cdk.Duration.minutes(6),
+        enforceSSL: true,
+        deadLetterQueue: {
+          queue: plcDataDeadLetterQueue,
+          maxReceiveCount: 3,
+        },
+      });
+      const plcDataQueueRole = new iam.Role(this, "PlcDataQueueRole", {
+        assumedBy: new iam.ServicePrincipal("iot.amazonaws.com"),
+      });
+      plcDataQueue.grantSendMessages(plcDataQueueRole);
+      publishErrorTopicFunction.addEventSource(
+        new SqsEventSource(plcDataQueue, {
+          batchSize: 100,
+          maxBatchingWindow: cdk.Duration.seconds(5),
+          // A malformed message is retried and dead-lettered alone, not with the whole batch.
+          reportBatchItemFailures: true,
+        })
+      );
+      plcDataAction = {
+        sqs: {
+          queueUrl: plcDataQueue.queueUrl,
+          roleArn: plcDataQueueRole.roleArn,
+          useBase64: false,
+        },
+      };
+    }
+    if (ingestion === "stream") {
+      const plcDataStream = new kinesis.Stream(this, "PlcDataStream", {
+        shardCount: props.streamShardCount ?? 1,
+        encryption: kinesis.StreamEncryption.MANAGED,
+      });
+      const plcDataStreamRole = new iam.Role(this, "PlcDataStreamRole", {
+        assumedBy: new iam.ServicePrincipal("iot.amazonaws.com"),
+      });
+      plcDataStream.grantWrite(plcDataStreamRole);
+      const plcDataStreamDeadLetterQueue = new sqs.Queue(
+        this,
+        "PlcDataStreamDeadLetterQueue",
+        {
+          enforceSSL: true,
+        }
+      );
+      publishErrorTopicFunction.addEventSource(
+        new KinesisEventSource(plcDataStream, {
+          startingPosition: lambda.StartingPosition.LATEST,
+          batchSize: 100,
+          maxBatchingWindow: cdk.Duration.seconds(5),
+          retryAttempts: 3,
+          // Retry from the first failed record. Records already applied are skipped by their timestamp.
+          reportBatchItemFailures: true,
+          bisectBatchOnError: true,
+          // Records that still fail are recorded here instead of blocking the shard.
+          onFailure: new SqsDlq(plcDataStreamDeadLetterQueue),
+        })
+      );
+      // Messages of the same gateway go to the same shard and keep their order.
+      plcDataAction = {
+        kinesis: {
+          streamName: plcDataStream.streamName,
+          partitionKey: "${clientId()}",
+          roleArn: plcDataStreamRole.roleArn,
+        },
+      };
+    }
+
     // create iot topic rule for publish error topic
     const iotPublishErrorTopicRule = new iot.CfnTopicRule(
       this,
@@ -135,15 +423,10 @@ export class ErrorDetector extends Construct {
       {
         ruleName: ruleName,
         topicRulePayload: {
-          sql: "SELECT * FROM 'plc/data'",
+          // Keep the publisher identity so that error states are tracked per gateway.
+          sql: "SELECT *, clientId() AS gateway_id FROM 'plc/data'",
           ruleDisabled: false,
-          actions: [
-            {
-              lambda: {
-                functionArn: publishErrorTopicFunction.functionArn,
-              },
-            },
-          ],
+          actions: [plcDataAction],
           errorAction: {
             cloudwatchLogs: {
               logGroupName: logGroup.logGroupName,
@@ -179,6 +462,8 @@ export class ErrorDetector extends Construct {
             { jsonPath: "timestamp" },
             { jsonPath: "isNormal" },
             { jsonPath: "error" },
+            { jsonPath: "gateway_id" },
+            { jsonPath: "detector_key" },
           ],
         },
       }
@@ -269,7 +554,8 @@ export class ErrorDetector extends Construct {
                       payload: {
                         contentExpression: `\'{
                                                     \"timestamp\": \"\${$input.${errorDetectorInput.inputName}.timestamp}\",
-                                                    \"error\": \${$input.${errorDetectorInput.inputName}.error}
+                                                    \"error\": \${$input.${errorDetectorInput.inputName}.error},
+                                                    \"gateway_id\": \"\${$input.${errorDetectorInput.inputName}.gateway_id}\"
                                                   }\'`,
                         type: "JSON",
                       },
@@ -291,9 +577,12 @@ export class ErrorDetector extends Construct {
       this,
       "ErrorDetectorModel",
       {
-        detectorModelName: "ErrorDetectorModel",
+        // The detector key changed from "error" to "detector_key" (gateway#error),
+        // which replaces the detector model, so it needs a new name.
+        // The detectors of the old model are dropped; see the migration note of this construct.
+        detectorModelName: "GatewayErrorDetectorModel",
         detectorModelDefinition: errorDetectorModelDefinition,
-        key: "error",
+        key: "detector_key",
         evaluationMethod: "SERIAL",
         roleArn: iotEventsRole.roleArn,
       }
@@ -304,5 +593,122 @@ export class ErrorDetector extends Construct {
       principal: new iam.ServicePrincipal("iotevents.amazonaws.com"),
       sourceArn: errorDetectorModel.roleArn,
     });
+
+    // In "aggregate" mode, one message per PLC message is published to "plc/error_status".
+    // The "errors" attribute is a hex bitmap whose n-th bit is set when error code n is active.
+    // One detector per gateway keeps the last bitmap and invokes the Lambda function with the previous
+    // and current bitmaps whenever it changes, so that alerts are inserted for the newly raised codes.
+    if (publishMode === "aggregate") {
+      const errorStatusInput = new iotEvents.CfnInput(
+        this,
+        "ErrorStatusInput",
+        {
+          inputName: "ErrorStatusInput",
+          inputDefinition: {
+            attributes: [
+              { jsonPath: "timestamp" },
+              { jsonPath: "errors" },
+              { jsonPath: "gateway_id" },
+            ],
+          },
+        }
+      );
+
+      new iot.CfnTopicRule(this, "ErrorStatusIotTopic", {
+        topicRulePayload: {
+          sql: "SELECT * FROM 'plc/error_status'",
+          actions: [
+            {
+              iotEvents: {
+                inputName: errorStatusInput.inputName!,
+                roleArn: iotErrorTopicRole.roleArn,
+              },
+            },
+          ],
+          ruleDisabled: false,
+          awsIotSqlVersion: "2016-03-23",
+        },
+      });
+
+      const errorStatusDetectorModel = new iotEvents.CfnDetectorModel(
+        this,
+        "ErrorStatusDetectorModel",
+        {
+          detectorModelName: "ErrorStatusDetectorModel",
+          detectorModelDefinition: {
+            states: [
+              {
+                stateName: "Monitoring",
+                onEnter: {
+                  events: [
+                    {
+                      eventName: "init",
+                      condition: `true`,
+                      actions: [
+                        {
+                          setVariable: {
+                            variableName: "errors",
+                            value: `\'0\'`,
+                          },
+                        },
+                      ],
+                    },
+                  ],
+                },
+                onInput: {
+                  events: [
+                    {
+                      eventName: "invokeLambda",
+                      condition: `$input.${errorStatusInput.inputName}.errors != $variable.errors`,
+                      actions: [
+                        {
+                          lambda: {
+                            functionArn: insertAlertIntoDbFunction.functionArn,
+                            payload: {
+                              contentExpression: `\'{
+                                                    \"timestamp\": \"\${$input.${errorStatusInput.inputName}.timestamp}\",
+                                                    \"errors\": \"\${$input.${errorStatusInput.inputName}.errors}\",
+                                                    \"previous\": \"\${$variable.errors}\",
+                                                    \"gateway_id\": \"\${$input.${errorStatusInput.inputName}.gateway_id}\"
+                                                  }\'`,
+                              type: "JSON",
+                            },
+                          },
+                        },
+                      ],
+                    },
+                    {
+                      eventName: "updateErrors",
+                      condition: `true`,
+                      actions: [
+                        {
+                          setVariable: {
+                            variableName: "errors",
+                            value: `$input.${errorStatusInput.inputName}.errors`,
+                          },
+                        },
+                      ],
+                    },
+                  ],
+                  transitionEvents: [],
+                },
+                onExit: {
+                  events: [],
+                },
+              },
+            ],
+            initialStateName: "Monitoring",
+          },
+          key: "gateway_id",
+          evaluationMethod: "SERIAL",
+          roleArn: iotEventsRole.roleArn,
+        }
+      );
+
+      insertAlertIntoDbFunction.addPermission("AddIotEventStatusTrigger", {
+        principal: new iam.ServicePrincipal("iotevents.amazonaws.com"),
+        sourceArn: errorStatusDetectorModel.roleArn,
+      });
+    }
   }
 }
@@ -9,7 +9,13 @@ import { S3Buckets } from "./constructs/s3buckets";
 import { Knowledge } from "./constructs/knowledge";
 import { CloudFrontGateway } from "./constructs/cloudfront-gateway";
 import { UsEast1Stack } from "./us-east-1-stack";
-import { FunctionUrlAuthType, InvokeMode } from "aws-cdk-lib/aws-lambda";
+import {
+  Code,
+  FunctionUrlAuthType,
+  InvokeMode,
+  LayerVersion,
+  Runtime,
+} from "aws-cdk-lib/aws-lambda";
 import { ChunkingStrategy } from "@cdklabs/generative-ai-cdk-constructs/lib/cdk-lib/bedrock";
 import { IotPipeline } from "./constructs/iot-pipeline";
 import { ErrorDetector } from "./constructs/error-detector";
@@ -41,11 +47,27 @@ export class KnowledgeTransferStack extends cdk.Stack {
     const bedrockRegion = props.bedrockRegion ?? "us-west-2";
 
     const auth = new Auth(this, "Auth");
-    const database = new Database(this, "Database");
+    const database = new Database(this, "Database", {
+      // Enable with `-c alertCategoryIndex=true` once the alert table has "status-index".
+      categoryIndex:
+        String(this.node.tryGetContext("alertCategoryIndex")) === "true",
+    });
     const buckets = new S3Buckets(this, "S3Buckets");
 
+    // Python modules shared by the alert manager Lambda functions
+    const alertManagerCommonLayer = new LayerVersion(
+      this,
+      "AlertManagerCommonLayer",
+      {
+        code: Code.fromAsset("../backend/alert_manager/lambda/common"),
+        compatibleRuntimes: [Runtime.PYTHON_3_11],
+      }
+    );
+
     const errorDetector = new ErrorDetector(this, "ErrorDetector", {
       alertsTable: database.alertTable,
+      alertSummaryTable: database.alertSummaryTable,
+      commonLayer: alertManagerCommonLayer,
       errordbTableName: "error_info_table",
       ruleName: "proc_demo_iot_publish_error_topic_rule",
     });
@@ -66,7 +88,11 @@ export class KnowledgeTransferStack extends cdk.Stack {
       "AlertsTimeseriesAPI",
       {
         alertsTable: database.alertTable,
+        alertCategoryIndexName: database.alertCategoryIndexName,
+        alertSummaryTable: database.alertSummaryTable,
         auth: auth,
+        commonLayer: alertManagerCommonLayer,
+        errorTable: errorDetector.errorTable,
         timeseriesDatabase: database.timeseriesDatabase,
         timeseriesTable: database.timeseriesTable,
       }